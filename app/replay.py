@@ -0,0 +1,257 @@
+"""
+Replay captured traffic through the AI Agent pipeline.
+
+Every upstream (PhoBERT TelecomGate, Reasoning Router, RAG, Gemini) is
+substituted by the responses and timings recorded in the capture log, so
+CPU and latency regressions of a build can be measured in isolation from
+upstream variance.
+
+Inquiries are replayed concurrently, arriving with their recorded gaps, so
+contention (locks, RAG pools, streaming threads) shows up as it does in
+production.
+
+Usage:
+    python -m app.replay capture/traffic.tcap [capture/traffic.tcap.1 ...] [--speed 0] [--repeat 3] [--concurrency 16]
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+from .services.AIAgent import AIAgent
+from .services.SessionStore import InMemorySessionStore
+from .services.TrafficCapture import TrafficCapture, read_capture
+from .utils.LatencyTracker import LatencyTracker
+
+
+class ReplayState:
+    """Upstream state of one in-flight replayed inquiry."""
+
+    def __init__(self, record: dict):
+        self.record = record
+        self.used_rag_calls: set[int] = set()
+        self.lock = threading.Lock()
+
+
+_current_state: contextvars.ContextVar[ReplayState] = contextvars.ContextVar("replay_state")
+
+
+class ContextPropagatingExecutor(ThreadPoolExecutor):
+    """Thread pool that runs tasks in the submitter's context, so upstream calls see their inquiry's state."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ReplayUpstreams:
+    """Serves the recorded upstream responses of the inquiry being replayed in the current context."""
+
+    def __init__(self, speed: float):
+        self.speed = speed
+
+    def load(self, record: dict):
+        _current_state.set(ReplayState(record))
+
+    @property
+    def state(self) -> ReplayState:
+        return _current_state.get()
+
+    @property
+    def record(self) -> dict:
+        return self.state.record
+
+    def sleep(self, seconds: float):
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds * self.speed)
+
+    def classifier(self, name: str, default):
+        recorded = self.record.get("classifiers", {}).get(name)
+        if recorded is None:
+            return default
+        self.sleep(recorded["duration"])
+        return recorded["decision"]
+
+    def rag_call(self, method: str, params: dict) -> str:
+        state = self.state
+        calls = state.record.get("rag_calls", [])
+        with state.lock:
+            # Hedged calls of the same inquiry run in parallel
+            candidates = [i for i, call in enumerate(calls) if i not in state.used_rag_calls and call["method"] == method]
+            exact = [i for i in candidates if calls[i]["params"] == params]
+            chosen = (exact or candidates or [None])[0]
+            if chosen is not None:
+                state.used_rag_calls.add(chosen)
+
+        if chosen is None:
+            # The capture reused a cached context or took another branch; serve its final context
+            context = state.record.get("context")
+            if context is None:
+                raise Exception(f"No recorded response for {method}")
+            return context
+
+        call = calls[chosen]
+        self.sleep(call["duration"])
+        if call["error"] is not None:
+            raise Exception(call["error"])
+        return call["context"]
+
+
+class ReplayTelecomGateClient:
+    def __init__(self, upstreams: ReplayUpstreams):
+        self.upstreams = upstreams
+
+    def infer(self, text: str) -> bool:
+        return self.upstreams.classifier("telecom_gate", self.upstreams.record.get("route") != "trivial")
+
+
+class ReplayReasoningRouterClient:
+    def __init__(self, upstreams: ReplayUpstreams):
+        self.upstreams = upstreams
+
+    def infer(self, text: str) -> str:
+        return self.upstreams.classifier("reasoning_router", self.upstreams.record.get("route") or "lookup_only")
+
+
+class ReplayRAGClient:
+    data_updated_at = 0.0
+
+    def __init__(self, upstreams: ReplayUpstreams):
+        self.upstreams = upstreams
+
+    def query_vectordb(self, query: str) -> str:
+        return self.upstreams.rag_call("query_vectordb", {"query": query})
+
+    def query_reasoning(self, chat_history: str, query: str) -> str:
+        return self.upstreams.rag_call("query_reasoning", {"chat_history": chat_history, "query": query})
+
+
+class ReplayGeminiService:
+    def __init__(self, upstreams: ReplayUpstreams):
+        self.upstreams = upstreams
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        start = time.monotonic()
+        for offset, token in self.upstreams.record.get("tokens", []):
+            if self.upstreams.speed > 0:
+                # Offsets are relative to the start of generation, not to the previous token
+                delay = offset * self.upstreams.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield token
+
+
+def replay(records: list[dict], speed: float, repeat: int, concurrency: int = 16) -> dict:
+    """
+    Replay records concurrently, each arriving at its recorded offset (scaled by
+    `speed`, so 0 submits them all at once), and measure the pipeline.
+
+    Latencies are measured from the scheduled arrival, so time spent waiting for
+    a free replay worker counts, as queueing does in production.
+
+    Returns:
+        Summary with latency / first-token percentiles, CPU time and outcome mismatches
+    """
+    upstreams = ReplayUpstreams(speed)
+    agent = AIAgent(
+        phobert_client=ReplayTelecomGateClient(upstreams),  # type: ignore[arg-type]
+        reasoning_client=ReplayReasoningRouterClient(upstreams),  # type: ignore[arg-type]
+        rag_client=ReplayRAGClient(upstreams),  # type: ignore[arg-type]
+        gemini_service=ReplayGeminiService(upstreams),  # type: ignore[arg-type]
+        session_store=InMemorySessionStore(),
+        traffic_capture=TrafficCapture(enabled=False),
+    )
+    # Same pool sizes as the agent's, but RAG calls must see the replayed inquiry's state
+    agent.rag_executor = ContextPropagatingExecutor(agent.rag_executor._max_workers, thread_name_prefix="rag")
+    agent.hedge_executor = ContextPropagatingExecutor(agent.hedge_executor._max_workers, thread_name_prefix="rag-hedge")
+
+    records = sorted(records, key=lambda record: record.get("started_at", 0.0))
+    first_arrival = records[0].get("started_at", 0.0) if records else 0.0
+
+    tracker = LatencyTracker(window_size=max(1, len(records) * repeat))
+    mismatches = 0
+    mismatches_lock = threading.Lock()
+
+    def run(record: dict, arrival: float):
+        nonlocal mismatches
+        upstreams.load(record)
+        first_token: float | None = None
+        try:
+            for _token in agent.handle_inquiry(record["inquiry"], record["history"], route=record.get("route")):
+                if first_token is None:
+                    first_token = time.monotonic() - arrival
+            outcome = "success"
+        except Exception as e:
+            outcome = f"error: {e}"
+
+        tracker.record("latency", time.monotonic() - arrival)
+        if first_token is not None:
+            tracker.record("first_token", first_token)
+        if record.get("outcome") not in (outcome, "empty", "abandoned"):
+            with mismatches_lock:
+                mismatches += 1
+
+    cpu_start = time.process_time()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        for _ in range(repeat):
+            pass_start = time.monotonic()
+            futures = []
+            for record in records:
+                arrival = pass_start + (record.get("started_at", first_arrival) - first_arrival) * speed
+                delay = arrival - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(run, record, arrival))
+            # Passes do not overlap
+            for future in futures:
+                future.result()
+
+    cpu_seconds = time.process_time() - cpu_start
+    runs = len(records) * repeat
+    return {
+        "inquiries": runs,
+        "concurrency": concurrency,
+        "outcome_mismatches": mismatches,
+        "cpu_seconds": round(cpu_seconds, 4),
+        "cpu_ms_per_inquiry": round(cpu_seconds * 1000 / runs, 3) if runs else 0.0,
+        "latency": _percentiles(tracker, "latency"),
+        "first_token": _percentiles(tracker, "first_token"),
+    }
+
+
+def _percentiles(tracker: LatencyTracker, name: str) -> dict:
+    return {
+        label: round(value, 4) if value is not None else None
+        for label, value in (
+            ("p50", tracker.percentile(name, 0.5)),
+            ("p95", tracker.percentile(name, 0.95)),
+            ("max", tracker.percentile(name, 1.0)),
+        )
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured AI Agent traffic with recorded upstream responses.")
+    parser.add_argument("paths", nargs="+", help="Capture files, replayed in the given order")
+    parser.add_argument("--speed", type=float, default=1.0, help="Scale of recorded upstream timings (0 = no delays, CPU only)")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of passes over the records")
+    parser.add_argument("--concurrency", type=int, default=16, help="Inquiries replayed at the same time at most")
+    args = parser.parse_args()
+
+    load_dotenv()
+    # Replay measures the pipeline itself; do not share work between records
+    os.environ["SINGLE_FLIGHT_MODE"] = "off"
+
+    records = [record for path in args.paths for record in read_capture(path)]
+    print(f"[Replay] Loaded {len(records)} records")
+    print(json.dumps(replay(records, args.speed, args.repeat, args.concurrency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,24 @@
 import os
+import time
+import queue
 import threading
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
 from .services.MessageQueueService import MessageQueueService
 from .services.AIAgent import AIAgent
+from .services.StreamPipeline import PipelinedStream, StreamPipelineMetrics
+from .services.AdminServer import AdminServer, json_response
+from .services.SamplingProfiler import SamplingProfiler
+from .services.RequestLedger import RequestLedger
+from .services.InquiryScheduler import (
+    InquiryScheduler,
+    ScheduledInquiry,
+    PRIORITY_CLASSES,
+    FAST_LANE,
+    STANDARD_LANE,
+    partition_queue,
+    tenant_bucket,
+)
 
 
 class AIAgentRPCServer:
@@ -11,13 +27,16 @@ class AIAgentRPCServer:
     def __init__(self):
         self.agent = AIAgent()
     
-    def handle_inquiry(self, inquiry: str, history: str):
+    def handle_inquiry(self, inquiry: str, history: str, conversation_id: str | None = None, route: str | None = None):
         """
         Handle inquiry and return generator for streaming response.
         
         Args:
             inquiry: The user's inquiry
             history: The chat history
+            conversation_id: Optional conversation id; when given, the agent keeps
+                             the history server-side and callers may send only the new turn
+            route: Optional route already decided by the scheduler's admission step
             
         Returns:
             Generator that yields response tokens
@@ -25,28 +44,47 @@ class AIAgentRPCServer:
         Raises:
             Exception: If processing fails
         """
-        return self.agent.handle_inquiry(inquiry, history)
+        return self.agent.handle_inquiry(inquiry, history, conversation_id, route)
+    
+    def classify(self, inquiry: str) -> str:
+        """Decide the route ("trivial", "lookup_only" or "reasoning_needed") of an inquiry."""
+        return self.agent.classify(inquiry)
+    
+    def warm_up_targets(self) -> dict:
+        """Warm-up probes of the agent's upstream services, by upstream name."""
+        return self.agent.warm_up_targets()
 
 
 class Controller:
     """Controller that processes incoming RabbitMQ messages."""
     
-    def __init__(self, mq: MessageQueueService, response_queue_name: str, rpc_server: AIAgentRPCServer):
+    def __init__(
+        self,
+        mq: MessageQueueService,
+        response_queue_name: str,
+        rpc_server: AIAgentRPCServer,
+        stream_metrics: StreamPipelineMetrics | None = None,
+        publish: Callable[[str, dict], None] | None = None
+    ):
         self.mq = mq
+        # Controllers running off the connection's thread hand responses over to it
+        self.publish = publish or mq.publish_message
         self.response_queue_name = response_queue_name
         self.rpc_server = rpc_server
+        self.pipelined_streaming = os.getenv("STREAM_PIPELINE_ENABLED", "true").lower() == "true"
+        self.stream_metrics = stream_metrics or StreamPipelineMetrics()
         self.method_map = {
             "handle_inquiry": self.rpc_server.handle_inquiry,
         }
     
-    def handle_message(self, message: dict):
+    def handle_message(self, message: dict, route: str | None = None):
         """Process an incoming request message."""
         request_id = message.get("id", None)
         if request_id is None:
             return  # Ignore messages without valid id
         
         try:
-            self.handle_message_with_id(request_id, message)
+            self.handle_message_with_id(request_id, message, route)
         except Exception as e:
             # Send error response
             error_response = {
@@ -57,9 +95,9 @@ class Controller:
                     "seq": 0,
                 }
             }
-            self.mq.publish_message(self.response_queue_name, error_response)
+            self.publish(self.response_queue_name, error_response)
     
-    def handle_message_with_id(self, request_id: str, message: dict):
+    def handle_message_with_id(self, request_id: str, message: dict, route: str | None = None):
         """Process request and send streaming responses."""
         method_name = message.get("method", "")
         if not method_name:
@@ -77,13 +115,20 @@ class Controller:
         
         inquiry = params.get("inquiry", "")
         history = params.get("history", "")
+        conversation_id = params.get("conversation_id", None)
         
         if not inquiry:
             raise ValueError("'inquiry' parameter is required")
         
+        if conversation_id is not None:
+            conversation_id = str(conversation_id)
+        
         # Call the method - it returns a generator
         try:
-            token_generator = method(inquiry, history)
+            token_generator = method(inquiry, history, conversation_id, route)
+            if self.pipelined_streaming:
+                # Generate on a separate thread so LLM reads and broker publishes overlap
+                token_generator = PipelinedStream(token_generator, metrics=self.stream_metrics)
             
             seq = 0
             # Stream tokens as individual responses
@@ -97,7 +142,7 @@ class Controller:
                             "seq": seq,
                         }
                     }
-                    self.mq.publish_message(self.response_queue_name, response)
+                    self.publish(self.response_queue_name, response)
                     seq += 1
             
             # Termination
@@ -110,7 +155,7 @@ class Controller:
                 }
             }
 
-            self.mq.publish_message(self.response_queue_name, termination_response)
+            self.publish(self.response_queue_name, termination_response)
         
         except Exception as e:
             # Error occurred, send error response
@@ -123,7 +168,7 @@ class Controller:
                     "seq": 0,
                 }
             }
-            self.mq.publish_message(self.response_queue_name, error_response)
+            self.publish(self.response_queue_name, error_response)
 
 
 class Server:
@@ -135,29 +180,204 @@ class Server:
         self.request_queue_name = os.getenv("AI_AGENT_REQUEST_QUEUE", "telcenter_ai_agent_requests")
         self.response_queue_name = os.getenv("AI_AGENT_RESPONSE_QUEUE", "telcenter_ai_agent_responses")
         self.threads: list[threading.Thread] = []
+        # Started by consumer threads for the requests they hand over; checked by /livez too
+        self.worker_threads: list[threading.Thread] = []
         self.num_threads = 4
         self.rpc_server = AIAgentRPCServer()
+        self.stream_metrics = StreamPipelineMetrics()
+        self.request_ledger = RequestLedger()
+        
+        # "fifo": consumers serve the request queue in order; "fair": requests are
+        # partitioned into broker queues per priority class and tenant bucket, then
+        # go through the in-process priority / fair-share scheduler
+        self.scheduling_mode = os.getenv("AI_AGENT_SCHEDULING", "fifo").lower()
+        if self.scheduling_mode not in ("fifo", "fair"):
+            raise ValueError(f"Unknown AI_AGENT_SCHEDULING: {self.scheduling_mode}")
+        self.scheduler = InquiryScheduler()
+        self.scheduler_prefetch = int(os.getenv("SCHEDULER_PREFETCH", "1"))
+        self.tenant_buckets = int(os.getenv("SCHEDULER_TENANT_BUCKETS", "8"))
+        self.router_prefetch = 64
+        self.fast_lane_workers = int(os.getenv("FAST_LANE_WORKERS", "1"))
+        # Requests this replica holds unacknowledged, admitted or waiting for a worker;
+        # the rest stay in the broker for other replicas
+        self.scheduler_max_admitted = int(
+            os.getenv("SCHEDULER_MAX_ADMITTED", "0")
+        ) or 2 * (self.num_threads + self.fast_lane_workers)
+        self.fast_lane_max_chars = int(os.getenv("FAST_LANE_MAX_INQUIRY_CHARS", "300"))
+        self.admission_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("SCHEDULER_ADMISSION_THREADS", "2")),
+            thread_name_prefix="admission",
+        )
+        
+        # Startup: upstreams are warmed before consumers start, and the server
+        # only reports ready once both are done
+        self.warmup_timeout = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "60"))
+        self.warmup_inquiries = [
+            inquiry.strip()
+            for inquiry in os.getenv("AI_AGENT_WARMUP_INQUIRIES", "").split("|")
+            if inquiry.strip()
+        ]
+        self.upstreams_warm: dict[str, bool] = {}
+        self.consumers_ready = 0
+        self.consumers_expected = 0
+        self.startup_lock = threading.Lock()
+        
+        self.admin = AdminServer()
+        self.admin.add_route("GET", "/livez", self._liveness)
+        self.admin.add_route("GET", "/readyz", self._readiness)
+        self.admin.add_route("GET", "/metrics", self._metrics)
+        
+        # Sampling profiler, off by default and toggled at runtime over the admin server
+        self.profiler = SamplingProfiler()
+        self.admin.add_route("POST", "/debug/profiler/start", self._start_profiler)
+        self.admin.add_route("POST", "/debug/profiler/stop", self._stop_profiler)
+        self.admin.add_route("POST", "/debug/profiler/reset", self._reset_profiler)
+        self.admin.add_route("GET", "/debug/profiler", lambda query: json_response(200, self.profiler.status()))
+        self.admin.add_route("GET", "/debug/profiler/folded", lambda query: (200, "text/plain", self.profiler.folded()))
     
     def start(self):
-        """Start the server with multiple consumer threads."""
+        """Start the admin endpoints, warm up upstreams, then start the consumer threads."""
+        self.admin.start()
+        self._warm_up()
+        
         print(f"[AIAgentServer] Starting with {self.num_threads} threads...")
         print(f"[AIAgentServer] Request queue: {self.request_queue_name}")
         print(f"[AIAgentServer] Response queue: {self.response_queue_name}")
         
-        self.threads = [
-            threading.Thread(target=self._consume_in_background, daemon=True)
-            for _ in range(self.num_threads)
-        ]
+        if self.scheduling_mode == "fair":
+            print(f"[AIAgentServer] Fair scheduling with {self.fast_lane_workers} reserved fast-lane threads, "
+                  f"admitting up to {self.scheduler_max_admitted} requests")
+            self.threads = [
+                threading.Thread(target=self._route_requests, daemon=True),
+                threading.Thread(target=self._consume_into_scheduler, daemon=True),
+            ]
+            self.threads += [
+                threading.Thread(target=self._serve_scheduled, args=((STANDARD_LANE, FAST_LANE),), daemon=True)
+                for _ in range(self.num_threads)
+            ]
+            self.threads += [
+                threading.Thread(target=self._serve_scheduled, args=((FAST_LANE,),), daemon=True)
+                for _ in range(self.fast_lane_workers)
+            ]
+        else:
+            self.threads = [
+                threading.Thread(target=self._consume_in_background, daemon=True)
+                for _ in range(self.num_threads)
+            ]
+        self.consumers_expected = len(self.threads)
         for t in self.threads:
             t.start()
         
         print("[AIAgentServer] All threads started")
     
+    def _warm_up(self):
+        """
+        Warm up every upstream in parallel, retrying with backoff.
+        
+        Waits at most WARMUP_TIMEOUT_SECONDS; upstreams still cold by then keep
+        warming in the background and the server stays not ready until they succeed.
+        """
+        targets = self.rpc_server.warm_up_targets()
+        self.upstreams_warm = {name: False for name in targets}
+        
+        def _warm(name: str, probe):
+            delay = 1.0
+            while True:
+                try:
+                    start = time.monotonic()
+                    probe()
+                    print(f"[AIAgentServer] Warmed up {name} in {time.monotonic() - start:.2f}s")
+                    with self.startup_lock:
+                        self.upstreams_warm[name] = True
+                    return
+                except Exception as e:
+                    print(f"[AIAgentServer] Warm-up of {name} failed, retrying in {delay:.0f}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+        
+        warmers = [
+            threading.Thread(target=_warm, args=(name, probe), daemon=True)
+            for name, probe in targets.items()
+        ]
+        for t in warmers:
+            t.start()
+        
+        deadline = time.monotonic() + self.warmup_timeout
+        for t in warmers:
+            t.join(max(0.0, deadline - time.monotonic()))
+        
+        if not all(self.upstreams_warm.values()):
+            cold = [name for name, warm in self.upstreams_warm.items() if not warm]
+            print(f"[AIAgentServer] Starting with cold upstreams: {', '.join(cold)}")
+            return
+        
+        for inquiry in self.warmup_inquiries:
+            try:
+                for _ in self.rpc_server.handle_inquiry(inquiry, ""):
+                    pass
+                print(f"[AIAgentServer] Warm-up inquiry completed: {inquiry}")
+            except Exception as e:
+                print(f"[AIAgentServer] Warm-up inquiry failed: {inquiry}: {e}")
+    
+    def _mark_consumer_ready(self):
+        with self.startup_lock:
+            self.consumers_ready += 1
+    
+    def is_ready(self) -> bool:
+        with self.startup_lock:
+            return (
+                self.consumers_expected > 0
+                and self.consumers_ready >= self.consumers_expected
+                and all(self.upstreams_warm.values())
+            )
+    
+    def _liveness(self, query: dict) -> tuple[int, str, str]:
+        with self.startup_lock:
+            threads = self.threads + self.worker_threads
+        dead = sum(1 for t in threads if not t.is_alive())
+        status = 503 if dead else 200
+        return json_response(status, {"alive": not dead, "dead_threads": dead})
+    
+    def _readiness(self, query: dict) -> tuple[int, str, str]:
+        with self.startup_lock:
+            payload = {
+                "upstreams_warm": dict(self.upstreams_warm),
+                "consumers_ready": self.consumers_ready,
+                "consumers_expected": self.consumers_expected,
+            }
+        ready = self.is_ready()
+        payload["ready"] = ready
+        return json_response(200 if ready else 503, payload)
+    
+    def _metrics(self, query: dict) -> tuple[int, str, str]:
+        return json_response(200, {
+            "stream_pipeline": self.stream_metrics.snapshot(),
+            "scheduler_backlog": self.scheduler.backlog(),
+            "amqp": self.mq_service.stats.snapshot(),
+            "duplicate_requests": self.request_ledger.duplicates,
+        })
+    
     def wait(self):
         """Wait for all threads to complete."""
         for t in self.threads:
             t.join()
     
+    def _start_profiler(self, query: dict) -> tuple[int, str, str]:
+        interval_ms = query.get("interval_ms")
+        try:
+            self.profiler.start(float(interval_ms[0]) / 1000 if interval_ms else None)
+        except ValueError as e:
+            return json_response(400, {"error": f"Invalid interval_ms: {e}"})
+        return json_response(200, self.profiler.status())
+    
+    def _stop_profiler(self, query: dict) -> tuple[int, str, str]:
+        self.profiler.stop()
+        return json_response(200, self.profiler.status())
+    
+    def _reset_profiler(self, query: dict) -> tuple[int, str, str]:
+        self.profiler.reset()
+        return json_response(200, self.profiler.status())
+    
     def _consume_in_background(self):
         """Background thread that consumes messages from the request queue."""
         with self.mq_lock:
@@ -166,9 +386,184 @@ class Server:
         mq.declare_queue(self.request_queue_name)
         mq.declare_queue(self.response_queue_name)
         
-        controller = Controller(mq, self.response_queue_name, self.rpc_server)
-        mq.register_callback(self.request_queue_name, controller.handle_message)
+        # Requests are handled on a worker thread, while this thread keeps servicing
+        # the connection: heartbeats, responses handed over by the worker, and acks
+        inbox: queue.Queue = queue.Queue()
+        controller = Controller(
+            mq,
+            self.response_queue_name,
+            self.rpc_server,
+            self.stream_metrics,
+            publish=mq.publish_message_threadsafe,
+        )
+        worker = threading.Thread(target=self._serve_inbox, args=(inbox, controller), daemon=True)
+        with self.startup_lock:
+            self.worker_threads.append(worker)
+        worker.start()
+        
+        mq.register_deferred_callback(
+            self.request_queue_name,
+            lambda message, ack: inbox.put((message, ack)),
+            prefetch_count=1,
+        )
+        self._mark_consumer_ready()
+        mq.start_consuming()
+    
+    def _serve_inbox(self, inbox: queue.Queue, controller: Controller):
+        """Worker thread that handles the requests delivered to one fifo consumer, one at a time."""
+        while True:
+            message, ack = inbox.get()
+            self._handle_once(controller, message, ack)
+    
+    def _handle_once(self, controller: Controller, message: Any, ack: Callable[[], None], route: str | None = None):
+        """
+        Handle a request unless it redelivers one already handled, then acknowledge it.
+        
+        If not even an error response could be published, the request is not recorded
+        as answered, and a redelivery that waited for it is handled in its place.
+        """
+        request_id = message.get("id") if isinstance(message, dict) else None
+        if request_id is not None and not self.request_ledger.begin(str(request_id), ack):
+            return
+        
+        while True:
+            try:
+                controller.handle_message(message, route)
+            except Exception as e:
+                print(f"[AIAgentServer] Could not deliver the response to request {request_id}: {e}")
+                ack()
+                if request_id is None:
+                    return
+                next_ack = self.request_ledger.abandon(str(request_id))
+                if next_ack is None:
+                    return
+                ack = next_ack
+                continue
+            
+            if request_id is not None:
+                self.request_ledger.finish(str(request_id))
+            ack()
+            return
+    
+    def _route_requests(self):
+        """
+        Background thread that partitions the request queue into broker queues per
+        priority class and tenant bucket.
+        """
+        with self.mq_lock:
+            mq = self.mq_service.clone()
+        
+        mq.declare_queue(self.request_queue_name)
+        for priority_name in PRIORITY_CLASSES:
+            for bucket in range(self.tenant_buckets):
+                mq.declare_queue(partition_queue(self.request_queue_name, priority_name, bucket))
+        
+        # Callers publish to the shared request queue; drain it into the partitions
+        mq.register_callback(
+            self.request_queue_name,
+            lambda message: mq.publish_message(self._partition_for(message), message),
+            prefetch_count=self.router_prefetch,
+        )
+        self._mark_consumer_ready()
+        mq.start_consuming()
+    
+    def _consume_into_scheduler(self):
+        """
+        Background thread that moves requests from the partition queues into the scheduler.
+        
+        A flooding tenant only backs up its own partitions; every partition keeps its
+        own prefetch window, so the scheduler always sees the heads of the others.
+        The channel-wide cap bounds what this replica holds in total, so requests
+        it cannot serve soon stay in the broker for other replicas.
+        """
+        with self.mq_lock:
+            mq = self.mq_service.clone()
+        
+        mq.declare_queue(self.response_queue_name)
+        mq.set_channel_prefetch(self.scheduler_max_admitted)
+        
+        for priority_name in PRIORITY_CLASSES:
+            for bucket in range(self.tenant_buckets):
+                queue_name = partition_queue(self.request_queue_name, priority_name, bucket)
+                mq.declare_queue(queue_name)
+                # Messages stay unacknowledged until a worker has handled them
+                mq.register_deferred_callback(
+                    queue_name,
+                    lambda message, ack: self.admission_pool.submit(self._admit_safely, message, ack),
+                    prefetch_count=self.scheduler_prefetch,
+                )
+        
+        self._mark_consumer_ready()
         mq.start_consuming()
+    
+    def _tenant_and_priority(self, message: Any) -> tuple[str, str]:
+        """Tenant identity and priority class name of a request, from its params."""
+        params = message.get("params", {}) if isinstance(message, dict) else {}
+        if not isinstance(params, dict):
+            params = {}
+        
+        tenant = str(params.get("tenant_id") or params.get("source") or params.get("channel") or "default")
+        priority_name = str(params.get("priority", "normal")).lower()
+        if priority_name not in PRIORITY_CLASSES:
+            priority_name = "normal"
+        return tenant, priority_name
+    
+    def _partition_for(self, message: Any) -> str:
+        tenant, priority_name = self._tenant_and_priority(message)
+        return partition_queue(self.request_queue_name, priority_name, tenant_bucket(tenant, self.tenant_buckets))
+    
+    def _admit_safely(self, message: Any, ack: Callable[[], None]):
+        """Admit a request; one that cannot be admitted is dropped instead of holding its prefetch slot."""
+        try:
+            self._admit(message, ack)
+        except Exception as e:
+            print(f"[AIAgentServer] Dropping request that could not be admitted: {e}")
+            ack()
+    
+    def _admit(self, message: dict, ack: Callable[[], None]):
+        """Classify a request into a lane, priority class and tenant, then enqueue it."""
+        if not isinstance(message, dict):
+            raise ValueError("Request is not a JSON object")
+        
+        params = message.get("params", {})
+        if not isinstance(params, dict):
+            params = {}
+        
+        tenant, priority_name = self._tenant_and_priority(message)
+        priority = PRIORITY_CLASSES[priority_name]
+        
+        route = None
+        lane = STANDARD_LANE
+        inquiry = params.get("inquiry", "")
+        if message.get("method") == "handle_inquiry" and isinstance(inquiry, str) and inquiry:
+            try:
+                route = self.rpc_server.classify(inquiry)
+            except Exception as e:
+                # Let the worker retry classification and report the error
+                print(f"[AIAgentServer] Classification during admission failed: {e}")
+            
+            if route in ("trivial", "lookup_only") and len(inquiry) <= self.fast_lane_max_chars:
+                lane = FAST_LANE
+        
+        self.scheduler.submit(ScheduledInquiry(message, ack, tenant, priority, lane, route))
+    
+    def _serve_scheduled(self, lanes: tuple[str, ...]):
+        """Background thread that handles scheduled requests from the given lanes."""
+        with self.mq_lock:
+            mq = self.mq_service.clone()
+        
+        mq.declare_queue(self.response_queue_name)
+        
+        controller = Controller(mq, self.response_queue_name, self.rpc_server, self.stream_metrics)
+        self._mark_consumer_ready()
+        while True:
+            inquiry = self.scheduler.take(lanes, timeout=mq.keep_alive_interval)
+            if inquiry is None:
+                # Keep the idle publishing connection alive, or reopen it
+                mq.process_events()
+                continue
+            
+            self._handle_once(controller, inquiry.message, inquiry.ack, inquiry.route)
 
 
 def main():
@@ -1,8 +1,19 @@
-from typing import Iterator
+import os
+import time
+import hashlib
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Hashable, Iterator, Literal
 from .HttpClients import PhoBERTTelecomGateClient, ReasoningRouterClient
 from .RAGClient import RAGClient
 from .GeminiService import GeminiService
+from .SessionStore import SessionStore, ConversationSession, create_session_store
+from .ContextCache import ConversationContextCache
+from .SingleFlight import SingleFlight, StreamSingleFlight, StreamFlight
+from .HedgePolicy import HedgePolicy
+from .TrafficCapture import TrafficCapture, CaptureRecord
 from ..utils.PromptLoader import PromptLoader
+from ..utils.LatencyTracker import LatencyTracker
 
 
 class AIAgent:
@@ -13,7 +24,7 @@ class AIAgent:
     1. Check if inquiry is telecom-related (PhoBERT TelecomGate)
     2. If not telecom-related: use trivial prompt and answer
     3. If telecom-related: check if reasoning is needed (Reasoning Router)
-    4. If reasoning needed: try RAG reasoning, fallback to RAG vectorstore
+    4. If reasoning needed: try RAG reasoning, hedged by a concurrent RAG vectorstore query
     5. If reasoning not needed: use RAG vectorstore
     6. Generate answer using LLM with context
     """
@@ -24,7 +35,11 @@ class AIAgent:
         reasoning_client: ReasoningRouterClient | None = None,
         rag_client: RAGClient | None = None,
         gemini_service: GeminiService | None = None,
-        prompt_loader: PromptLoader | None = None
+        prompt_loader: PromptLoader | None = None,
+        session_store: SessionStore | None = None,
+        context_cache: ConversationContextCache | None = None,
+        hedge_policy: HedgePolicy | None = None,
+        traffic_capture: TrafficCapture | None = None
     ):
         """Initialize AI Agent with service dependencies."""
         self.phobert_client = phobert_client or PhoBERTTelecomGateClient()
@@ -32,14 +47,51 @@ class AIAgent:
         self.rag_client = rag_client or RAGClient()
         self.gemini_service = gemini_service or GeminiService()
         self.prompt_loader = prompt_loader or PromptLoader()
+        self.session_store = session_store if session_store is not None else create_session_store()
+        self.session_max_turns = int(os.getenv("SESSION_MAX_HISTORY_TURNS", "10"))
+        self.session_older_history_max_chars = int(os.getenv("SESSION_OLDER_HISTORY_MAX_CHARS", "4000"))
+        self.context_cache = context_cache or ConversationContextCache()
+        
+        # "off": no deduplication, "upstream": share identical in-flight classifier
+        # and RAG calls, "full": additionally run identical inquiries once and fan
+        # the token stream out to every waiting request
+        self.single_flight_mode = os.getenv("SINGLE_FLIGHT_MODE", "upstream").lower()
+        if self.single_flight_mode not in ("off", "upstream", "full"):
+            raise ValueError(f"Unknown SINGLE_FLIGHT_MODE: {self.single_flight_mode}")
+        self.upstream_flights = SingleFlight()
+        self.inquiry_flights = StreamSingleFlight()
+        
+        self.latency_tracker = LatencyTracker()
+        self.hedge_policy = hedge_policy or HedgePolicy(self.latency_tracker)
+        self.rag_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_HEDGE_THREADS", "16")),
+            thread_name_prefix="rag",
+        )
+        # Hedges run on their own pool: abandoned reasoning calls can hold every
+        # rag_executor worker for the full RAG timeout exactly when hedging is needed
+        self.hedge_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_HEDGE_FALLBACK_THREADS", "8")),
+            thread_name_prefix="rag-hedge",
+        )
+        self.traffic_capture = traffic_capture or TrafficCapture()
     
-    def handle_inquiry(self, inquiry: str, history: str) -> Iterator[str]:
+    def handle_inquiry(
+        self,
+        inquiry: str,
+        history: str,
+        conversation_id: str | None = None,
+        route: str | None = None
+    ) -> Iterator[str]:
         """
         Handle a user inquiry and yield response tokens as they are generated.
         
         Args:
             inquiry: The user's question/inquiry
-            history: The chat history
+            history: The chat history. With a conversation_id, an empty history
+                     means "continue the stored session", while a non-empty one
+                     replaces the stored history.
+            conversation_id: Optional conversation id for the server-side session store
+            route: Optional route already decided by classify(), skipping the classifiers
             
         Yields:
             Response tokens from the LLM
@@ -48,12 +100,258 @@ class AIAgent:
             Exception: If any step in the process fails, with special "FORWARD" message
                       for cases where the agent cannot answer
         """
+        session = self._load_session(conversation_id, history)
+        if session is not None:
+            history = session.render_history()
+        
+        capture = self.traffic_capture.start(inquiry, history)
+        answer_tokens: list[str] = []
+        try:
+            for token in self._stream_answer(inquiry, history, session, route, capture):
+                answer_tokens.append(token)
+                yield token
+        except GeneratorExit:
+            # The consumer stopped reading mid-answer; neither a success nor an error
+            if capture is not None:
+                capture.finish("abandoned")
+            raise
+        except Exception as e:
+            if capture is not None:
+                capture.finish(f"error: {e}")
+            raise
+        finally:
+            if capture is not None:
+                if capture.data["outcome"] is None:
+                    capture.finish("success" if answer_tokens else "empty")
+                self.traffic_capture.write(capture)
+        
+        if session is None:
+            return
+        
+        answer = "".join(answer_tokens)
+        self.context_cache.remember_codes(session, inquiry, answer)
+        session.append_turn(
+            inquiry,
+            answer,
+            max_turns=self.session_max_turns,
+            older_history_max_chars=self.session_older_history_max_chars,
+        )
+        self.session_store.put(session)  # type: ignore[union-attr]
+    
+    def warm_up_targets(self) -> dict[str, Callable[[], None]]:
+        """Warm-up probes of the upstream services, by upstream name."""
+        return {
+            "telecom_gate": self.phobert_client.warm_up,
+            "reasoning_router": self.reasoning_client.warm_up,
+            "rag": self.rag_client.warm_up,
+            "gemini": self.gemini_service.warm_up,
+        }
+    
+    def classify(self, inquiry: str) -> Literal["trivial", "lookup_only", "reasoning_needed"]:
+        """
+        Decide the route of an inquiry without answering it.
+        
+        Returns:
+            "trivial" if the inquiry is not telecom-related, otherwise the Reasoning Router decision
+        """
+        if not self._is_telecom(inquiry):
+            return "trivial"
+        return self._reasoning_mode(inquiry)
+    
+    def _is_telecom(self, inquiry: str, capture: CaptureRecord | None = None) -> bool:
+        start = time.monotonic()
+        is_telecom = self._upstream(("telecom_gate", inquiry), lambda: self.phobert_client.infer(inquiry))
+        if capture is not None:
+            capture.classifier("telecom_gate", is_telecom, time.monotonic() - start)
+        return is_telecom
+    
+    def _reasoning_mode(self, inquiry: str, capture: CaptureRecord | None = None) -> Literal["lookup_only", "reasoning_needed"]:
+        start = time.monotonic()
+        reasoning_mode = self._upstream(("reasoning_router", inquiry), lambda: self.reasoning_client.infer(inquiry))
+        if capture is not None:
+            capture.classifier("reasoning_router", reasoning_mode, time.monotonic() - start)
+        return reasoning_mode
+    
+    def _query_vectordb(self, query: str, capture: CaptureRecord | None = None) -> str:
+        return self._rag_call("query_vectordb", {"query": query}, capture, lambda: self._upstream(
+            ("query_vectordb", query),
+            lambda: self.rag_client.query_vectordb(query),
+        ))
+    
+    def _query_reasoning(self, history: str, inquiry: str, capture: CaptureRecord | None = None) -> str:
+        return self._rag_call("query_reasoning", {"chat_history": history, "query": inquiry}, capture, lambda: self._upstream(
+            ("query_reasoning", history, inquiry),
+            lambda: self.rag_client.query_reasoning(history, inquiry),
+        ))
+    
+    def _rag_call(self, method: str, params: dict, capture: CaptureRecord | None, fn: Callable[[], str]) -> str:
+        """Run a RAG call, recording its latency if it succeeds and capturing it if enabled."""
+        start = time.monotonic()
+        try:
+            context = fn()
+        except Exception as e:
+            if capture is not None:
+                capture.rag_call(method, params, time.monotonic() - start, error=str(e))
+            raise
+        
+        duration = time.monotonic() - start
+        self.latency_tracker.record(method, duration)
+        if capture is not None:
+            capture.rag_call(method, params, duration, context=context)
+        return context
+    
+    def _query_reasoning_hedged(
+        self,
+        history: str,
+        inquiry: str,
+        route: str,
+        capture: CaptureRecord | None = None
+    ) -> str:
+        """
+        Query RAG reasoning, hedged by a vectorstore query.
+        
+        The vectorstore query starts after the route's hedge delay (or as soon as
+        reasoning fails). Reasoning wins if it succeeds within the route's budget;
+        after that, whichever query succeeds first is used, until the hedge deadline.
+        
+        Raises:
+            Exception: "FORWARD" if both queries fail
+        """
+        hedge_delay, budget = self.hedge_policy.for_route(route)
+        start = time.monotonic()
+        
+        reasoning: Future = self.rag_executor.submit(self._query_reasoning, history, inquiry, capture)
+        wait([reasoning], timeout=hedge_delay)
+        if reasoning.done() and reasoning.exception() is None:
+            return reasoning.result()
+        
+        if reasoning.done():
+            print(f"[AIAgent] RAG reasoning failed, falling back to vectorstore: {reasoning.exception()}")
+        else:
+            print(f"[AIAgent] RAG reasoning still running after {hedge_delay:.1f}s, hedging with vectorstore.")
+        query = history + "\n\n" + inquiry
+        vectordb: Future = self.hedge_executor.submit(self._query_vectordb, query, capture)
+        
+        # Within the budget, keep waiting for reasoning
+        wait([reasoning], timeout=max(0.0, budget - (time.monotonic() - start)))
+        if reasoning.done() and reasoning.exception() is None:
+            vectordb.cancel()
+            return reasoning.result()
+        
+        # Past the budget, take the first successful result before the deadline
+        pending = {reasoning, vectordb}
+        while pending:
+            for future in (reasoning, vectordb):
+                if future.done() and future.exception() is None:
+                    if future is vectordb:
+                        print(f"[AIAgent] Using vectorstore context after {time.monotonic() - start:.1f}s.")
+                        # Reasoning may still be queued behind abandoned calls
+                        reasoning.cancel()
+                    else:
+                        vectordb.cancel()
+                    return future.result()
+            pending = {future for future in pending if not future.done()}
+            remaining = self.hedge_policy.deadline - (time.monotonic() - start)
+            if pending and remaining <= 0:
+                print(f"[AIAgent] No RAG context within the {self.hedge_policy.deadline:.0f}s hedge deadline.")
+                break
+            if pending:
+                wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        
+        for future in pending:
+            future.cancel()
+        # Cannot get context, must forward to human
+        raise Exception("FORWARD")
+    
+    def _stream_answer(
+        self,
+        inquiry: str,
+        history: str,
+        session: ConversationSession | None,
+        route: str | None,
+        capture: CaptureRecord | None = None
+    ) -> Iterator[str]:
+        """Answer the inquiry, sharing one pipeline run among identical concurrent inquiries."""
+        if self.single_flight_mode != "full":
+            return self._answer(inquiry, history, session, route, capture)
+        
+        # The pipeline runs against a copy of the leader's session; every
+        # participant adopts its route and context once the stream completes
+        scratch = ConversationSession.from_dict(session.to_dict()) if session is not None else None
+        # Only the leader's pipeline run is captured in detail
+        flight = self.inquiry_flights.join(
+            self._inquiry_fingerprint(inquiry, history, session),
+            lambda: self._answer(inquiry, history, scratch, route, capture),
+            scratch,
+        )
+        if capture is not None and flight.subscribers > 1:
+            capture.data["shared_flight"] = True
+        return self._follow_flight(flight, session)
+    
+    def _follow_flight(self, flight: StreamFlight, session: ConversationSession | None) -> Iterator[str]:
+        yield from flight.subscribe()
+        if session is not None and flight.payload is not None:
+            session.adopt_retrieval_state(flight.payload)
+    
+    def _inquiry_fingerprint(self, inquiry: str, history: str, session: ConversationSession | None) -> str:
+        """Fingerprint of everything that determines the answer to an inquiry."""
+        def normalize(text: str) -> str:
+            return " ".join(text.lower().split()).strip(" .?!")
+        
+        if session is None:
+            session_state = "no-session"
+        else:
+            session_state = f"{','.join(session.package_codes)}:{session.last_context or ''}"
+        
+        digest = hashlib.sha256()
+        for part in (normalize(inquiry), normalize(history), session_state):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def _upstream(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Call an upstream service, sharing identical in-flight calls unless disabled."""
+        if self.single_flight_mode == "off":
+            return fn()
+        return self.upstream_flights.do(key, fn)
+    
+    def _load_session(self, conversation_id: str | None, history: str) -> ConversationSession | None:
+        """Fetch or create the session for a conversation, if sessions are in use."""
+        if not conversation_id or self.session_store is None:
+            return None
+        
+        session = self.session_store.get(conversation_id)
+        if session is None:
+            session = ConversationSession(conversation_id)
+            session.reset_history(history)
+        elif history:
+            print(f"[AIAgent] Caller sent full history for conversation {conversation_id}, resetting session history.")
+            session.reset_history(history)
+        
+        return session
+    
+    def _answer(
+        self,
+        inquiry: str,
+        history: str,
+        session: ConversationSession | None,
+        route: str | None = None,
+        capture: CaptureRecord | None = None
+    ) -> Iterator[str]:
+        """Run the classification, retrieval and generation flow for one inquiry."""
         try:
             # Step 1-2: Check if inquiry is telecom-related
             print(f"[AIAgent] Checking if inquiry is telecom-related: {inquiry}")
-            is_telecom = self.phobert_client.infer(inquiry)
+            if route is not None:
+                is_telecom = route != "trivial"
+                if capture is not None:
+                    capture.data["route"] = route
+            else:
+                is_telecom = self._is_telecom(inquiry, capture)
             
             if not is_telecom:
+                if session is not None:
+                    session.last_route = "trivial"
                 print(f"[AIAgent] Inquiry is not telecom-related, using trivial prompt.")
                 prompt = self.prompt_loader.format(
                     "trivial.prompt.txt",
@@ -62,7 +360,7 @@ class AIAgent:
                 )
                 
                 print(f"[AIAgent] Generating response using trivial prompt.")
-                for token in self.gemini_service.generate_stream(prompt):
+                for token in self._generate(prompt, capture):
                     print(f"[AIAgent] Yielding token from trivial response: {token}")
                     if token.strip() == "IMPOSSIBLE":
                         raise Exception("FORWARD")
@@ -71,48 +369,24 @@ class AIAgent:
                 print(f"[AIAgent] Trivial response generation completed.")
                 return
             
-            # Step 3: Check if reasoning is needed
-            print(f"[AIAgent] Inquiry is telecom-related, checking if reasoning is needed.")
-            reasoning_mode = self.reasoning_client.infer(inquiry)
-            
-            context = None
-            
-            # Step 4-5: Get context from RAG
-            if reasoning_mode == "reasoning_needed":
-                # Try RAG reasoning first
-                print(f"[AIAgent] Reasoning needed, querying RAG reasoning.")
-                try:
-                    context = self.rag_client.query_reasoning(history, inquiry)
-                except Exception as e:
-                    # Fallback to vectorstore
-                    print(f"[AIAgent] RAG reasoning failed, falling back to vectorstore: {e}")
-                    try:
-                        context = self.rag_client.query_vectordb(history + "\n\n" + inquiry)
-                    except Exception as e2:
-                        # Cannot get context, must forward to human
-                        raise Exception("FORWARD")
-            else:
-                # Use vectorstore directly
-                print(f"[AIAgent] Reasoning not needed, querying RAG vectorstore.")
-                try:
-                    context = self.rag_client.query_vectordb(inquiry)
-                except Exception as e:
-                    # Cannot get context, must forward to human
-                    raise Exception("FORWARD")
+            # Step 3-5: Get context, reusing the previous turn's context when it still applies
+            with self._stage(capture, "retrieve_context"):
+                context = self._retrieve_context(inquiry, history, session, route, capture)
             
             # Step 6: Generate answer using master prompt
             print(f"[AIAgent] Generating response using master prompt with context.")
-            prompt = self.prompt_loader.format(
-                "master.prompt.txt",
-                chat_history=history,
-                query=inquiry,
-                context=context
-            )
+            with self._stage(capture, "prompt_format"):
+                prompt = self.prompt_loader.format(
+                    "master.prompt.txt",
+                    chat_history=history,
+                    query=inquiry,
+                    context=context
+                )
             
             # Check if LLM returns IMPOSSIBLE
             # We need to collect the full response to check this
             print(f"[AIAgent] Streaming response from GeminiService.")
-            for token in self.gemini_service.generate_stream(prompt):
+            for token in self._generate(prompt, capture):
                 if token.strip() == "IMPOSSIBLE":
                     raise Exception("FORWARD")
                 yield token
@@ -121,3 +395,77 @@ class AIAgent:
         except Exception as e:
             print(f"[AIAgent] Exception occurred: {e}")
             raise
+    
+    def _retrieve_context(
+        self,
+        inquiry: str,
+        history: str,
+        session: ConversationSession | None,
+        route: str | None = None,
+        capture: CaptureRecord | None = None
+    ) -> str:
+        """
+        Get the RAG context for a telecom-related inquiry.
+        
+        Follow-ups that the conversation's cached context still covers are answered
+        from the cache; otherwise the context is fetched and, for vectorstore lookups,
+        merged into the cached one.
+        
+        Raises:
+            Exception: "FORWARD" if no context can be retrieved
+        """
+        data_updated_at = self.rag_client.data_updated_at
+        context = self.context_cache.lookup(session, inquiry, data_updated_at)
+        if context is not None:
+            print(f"[AIAgent] Reusing RAG context from the previous turn.")
+            if capture is not None:
+                capture.context(context, reused=True)
+            return context
+        
+        # Step 3: Check if reasoning is needed
+        print(f"[AIAgent] Inquiry is telecom-related, checking if reasoning is needed.")
+        if route in ("lookup_only", "reasoning_needed"):
+            reasoning_mode = route
+        else:
+            reasoning_mode = self._reasoning_mode(inquiry, capture)
+        if session is not None:
+            session.last_route = reasoning_mode
+        
+        context = None
+        
+        # Step 4-5: Get context from RAG
+        if reasoning_mode == "reasoning_needed":
+            # Try RAG reasoning first, hedged by the vectorstore
+            print(f"[AIAgent] Reasoning needed, querying RAG reasoning.")
+            context = self._query_reasoning_hedged(history, inquiry, reasoning_mode, capture)
+        else:
+            # Use vectorstore directly
+            print(f"[AIAgent] Reasoning not needed, querying RAG vectorstore.")
+            try:
+                context = self._query_vectordb(inquiry, capture)
+            except Exception as e:
+                # Cannot get context, must forward to human
+                raise Exception("FORWARD")
+        
+        # Reasoning results are complete answers on their own; vectorstore lookups
+        # only cover the new inquiry, so keep the previous context alongside them
+        self.context_cache.store(session, context, data_updated_at, merge=reasoning_mode != "reasoning_needed")
+        if capture is not None:
+            capture.context(context, reused=False)
+        return context
+    
+    def _generate(self, prompt: str, capture: CaptureRecord | None) -> Iterator[str]:
+        """Stream tokens from the LLM, capturing their timings if enabled."""
+        if capture is None:
+            yield from self.gemini_service.generate_stream(prompt)
+            return
+        
+        with capture.stage("generate"):
+            capture.start_generation()
+            for token in self.gemini_service.generate_stream(prompt):
+                capture.token(token)
+                yield token
+    
+    def _stage(self, capture: CaptureRecord | None, name: str):
+        """Measure a pipeline stage if the inquiry is being captured."""
+        return capture.stage(name) if capture is not None else nullcontext()
@@ -0,0 +1,77 @@
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable
+from urllib.parse import urlparse, parse_qs
+
+
+# A route handler receives the parsed query string and returns (status, content type, body)
+RouteHandler = Callable[[dict[str, list[str]]], tuple[int, str, str]]
+
+
+def json_response(status: int, payload: dict) -> tuple[int, str, str]:
+    return status, "application/json", json.dumps(payload)
+
+
+class AdminServer:
+    """
+    Small HTTP server for operational endpoints (health probes, metrics, debugging).
+
+    Routes are registered by the components that own the data, e.g.
+    `admin.add_route("GET", "/readyz", handler)`.
+    """
+
+    def __init__(self, host: str | None = None, port: int | None = None):
+        self.host = host or os.getenv("ADMIN_HOST", "0.0.0.0")
+        self.port = port if port is not None else int(os.getenv("ADMIN_PORT", "8080"))
+        self.routes: dict[tuple[str, str], RouteHandler] = {}
+        self.httpd: ThreadingHTTPServer | None = None
+
+    def add_route(self, method: str, path: str, handler: RouteHandler):
+        self.routes[(method.upper(), path)] = handler
+
+    def start(self):
+        """Start serving on a background thread. A port of 0 disables the server."""
+        if self.port == 0:
+            print("[AdminServer] Disabled (ADMIN_PORT=0)")
+            return
+
+        routes = self.routes
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self, method: str):
+                url = urlparse(self.path)
+                handler = routes.get((method, url.path))
+                if handler is None:
+                    status, content_type, body = json_response(404, {"error": "not found"})
+                else:
+                    try:
+                        status, content_type, body = handler(parse_qs(url.query))
+                    except Exception as e:
+                        status, content_type, body = json_response(500, {"error": str(e)})
+
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, format, *args):
+                pass  # Probes are frequent; keep them out of the logs
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        print(f"[AdminServer] Listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
@@ -0,0 +1,181 @@
+import os
+import re
+import time
+from .SessionStore import ConversationSession
+
+
+# Package codes look like "SD70" or "V90B". A spaced form ("SD 70") is only
+# accepted in upper case, so phrases like "trong 30 ngày" are not mistaken for codes
+PACKAGE_CODE_PATTERN = re.compile(r"\b([A-Za-z]{1,5})(\d{2,4})([A-Za-z]{0,2})\b|\b([A-Z]{1,5}) (\d{2,4})([A-Z]{0,2})\b")
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Phrases referring back to a package discussed earlier, e.g. "gói đó", "gói cước này"
+PACKAGE_REFERENCE_PATTERN = re.compile(r"\b(?:gói(?: cước)?|ưu đãi|dịch vụ) (?:đó|này|ấy|kia|trên|vừa rồi|vừa nãy)\b", re.IGNORECASE)
+CONTEXT_BLOCK_SEPARATOR = "\n---\n"
+
+
+def extract_package_codes(text: str) -> set[str]:
+    """Extract normalized package codes (e.g. "SD 70" -> "SD70") from text."""
+    return {
+        "".join(group for group in match.groups() if group).upper()
+        for match in PACKAGE_CODE_PATTERN.finditer(text or "")
+    }
+
+
+# Vietnamese function words and customer-service filler that carry no topic on their own
+STOPWORDS = frozenset("""
+    anh ạ ai bao bạn bằng bị bởi các cái cần cho chị có của cũng cùng đã đang đâu để đến đều đó được em gì
+    giúp hay hãy hỏi hoặc khi khách không là làm lại mà mình muốn này nào nên nếu nhé nhiêu như những nữa
+    ơi ở quý ra rằng rồi sao sẽ tại thể thế thì tôi trên trong từ tới vào vậy về vì với vẫn xin hàng
+    một nó họ ấy kia đây thưa cảm ơn giùm dùm
+""".split())
+
+
+def tokenize(text: str) -> set[str]:
+    """Lowercase word tokens, ignoring single characters and stopwords."""
+    return {
+        token for token in WORD_PATTERN.findall((text or "").lower())
+        if len(token) > 1 and token not in STOPWORDS
+    }
+
+
+def refers_to_package(text: str) -> bool:
+    """Whether the text refers back to a previously discussed package (e.g. "gói đó")."""
+    return bool(PACKAGE_REFERENCE_PATTERN.search(text or ""))
+
+
+class ConversationContextCache:
+    """
+    Decides whether the RAG context of the previous turn can answer a follow-up.
+
+    The relevance score combines the lexical overlap between the inquiry and the
+    cached context (stopwords excluded) with how well the cached context covers
+    the packages the inquiry is about. Package coverage only counts when the
+    inquiry names a package or refers back to one ("gói đó"); otherwise the score
+    is the lexical overlap alone. An inquiry naming a package the cached context
+    does not cover is always treated as drift.
+    """
+
+    def __init__(
+        self,
+        threshold: float | None = None,
+        lexical_weight: float | None = None,
+        max_age_seconds: float | None = None,
+        max_context_chars: int | None = None,
+        max_package_codes: int = 20,
+    ):
+        self.threshold = threshold if threshold is not None else float(os.getenv("CONTEXT_REUSE_THRESHOLD", "0.6"))
+        self.lexical_weight = lexical_weight if lexical_weight is not None else float(os.getenv("CONTEXT_REUSE_LEXICAL_WEIGHT", "0.5"))
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else float(os.getenv("CONTEXT_REUSE_MAX_AGE_SECONDS", "600"))
+        self.max_context_chars = max_context_chars if max_context_chars is not None else int(os.getenv("CONTEXT_MAX_CHARS", "12000"))
+        self.max_package_codes = max_package_codes
+
+    def score(self, session: ConversationSession, inquiry: str) -> float:
+        """
+        Score how relevant the session's cached context is to a new inquiry.
+
+        Args:
+            session: The conversation session holding the cached context
+            inquiry: The new inquiry
+
+        Returns:
+            A score in [0, 1]; 0 if the inquiry drifted to packages outside the context
+        """
+        context = session.last_context or ""
+        context_codes = extract_package_codes(context)
+
+        inquiry_codes = extract_package_codes(inquiry)
+        if inquiry_codes and not inquiry_codes <= context_codes:
+            return 0.0
+
+        inquiry_tokens = tokenize(inquiry)
+        if inquiry_tokens:
+            lexical = len(inquiry_tokens & tokenize(context)) / len(inquiry_tokens)
+        else:
+            lexical = 0.0
+
+        if inquiry_codes:
+            referenced_codes = inquiry_codes
+        elif refers_to_package(inquiry):
+            referenced_codes = set(session.package_codes)
+        else:
+            # Nothing ties the inquiry to the cached packages; only its wording can
+            return lexical
+
+        if not referenced_codes:
+            return self.lexical_weight * lexical
+        coverage = len(referenced_codes & context_codes) / len(referenced_codes)
+        return self.lexical_weight * lexical + (1.0 - self.lexical_weight) * coverage
+
+    def lookup(self, session: ConversationSession | None, inquiry: str, data_updated_at: float) -> str | None:
+        """
+        Return the cached context if it is still fresh and relevant, otherwise None.
+
+        Args:
+            session: The conversation session, if any
+            inquiry: The new inquiry
+            data_updated_at: When the RAG data last changed; older contexts are invalidated
+        """
+        if session is None or not session.last_context:
+            return None
+
+        if session.context_fetched_at < data_updated_at:
+            print(f"[ContextCache] RAG data changed, invalidating context of conversation {session.conversation_id}")
+            session.last_context = None
+            return None
+
+        if time.time() - session.context_fetched_at > self.max_age_seconds:
+            return None
+
+        score = self.score(session, inquiry)
+        print(f"[ContextCache] Context relevance for conversation {session.conversation_id}: {score:.2f}")
+        if score < self.threshold:
+            return None
+
+        return session.last_context
+
+    def store(self, session: ConversationSession | None, context: str, data_updated_at: float, merge: bool = False):
+        """
+        Remember the context fetched for this turn.
+
+        Args:
+            session: The conversation session, if any
+            context: The freshly fetched context
+            data_updated_at: When the RAG data last changed, as seen before fetching
+            merge: Keep still-valid blocks of the previous context after the new ones
+        """
+        if session is None:
+            return
+
+        if merge and session.last_context and session.context_fetched_at >= data_updated_at:
+            context = self.merge(context, session.last_context)
+
+        session.last_context = context
+        session.context_fetched_at = time.time()
+
+    def merge(self, new_context: str, old_context: str) -> str:
+        """Merge two contexts block by block, newest first, bounded by max_context_chars."""
+        blocks: list[str] = []
+        for block in new_context.split(CONTEXT_BLOCK_SEPARATOR) + old_context.split(CONTEXT_BLOCK_SEPARATOR):
+            if block.strip() and block not in blocks:
+                blocks.append(block)
+
+        merged = ""
+        for block in blocks:
+            candidate = f"{merged}{CONTEXT_BLOCK_SEPARATOR}{block}" if merged else block
+            if len(candidate) > self.max_context_chars:
+                break
+            merged = candidate
+        return merged or new_context
+
+    def remember_codes(self, session: ConversationSession | None, *texts: str):
+        """Record package codes mentioned in this turn, most recent last."""
+        if session is None:
+            return
+
+        codes = list(session.package_codes)
+        for text in texts:
+            for code in sorted(extract_package_codes(text)):
+                if code in codes:
+                    codes.remove(code)
+                codes.append(code)
+        session.package_codes = codes[-self.max_package_codes:]
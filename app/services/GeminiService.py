@@ -1,6 +1,6 @@
 import os
-import google.generativeai as genai
-from typing import Iterator
+import threading
+from typing import Any, Iterator
 
 
 class GeminiService:
@@ -19,9 +19,24 @@ class GeminiService:
             raise ValueError("GEMINI_API_KEY must be set in environment or passed to constructor")
         
         self.model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-        
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel(self.model_name)
+        self._model: Any = None
+        self.lock = threading.Lock()
+    
+    @property
+    def model(self) -> Any:
+        """The Gemini model; the SDK is imported and configured on first use."""
+        if self._model is None:
+            with self.lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+    
+    def warm_up(self):
+        """Import the SDK and open the connection to Gemini with a cheap token count."""
+        self.model.count_tokens("xin chào")
     
     def generate_stream(self, prompt: str) -> Iterator[str]:
         """
@@ -0,0 +1,70 @@
+import os
+from ..utils.LatencyTracker import LatencyTracker
+
+
+def parse_route_seconds(spec: str) -> dict[str, float]:
+    """Parse "reasoning_needed=8,lookup_only=3" into a per-route mapping of seconds."""
+    values: dict[str, float] = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        route, _, seconds = entry.partition("=")
+        values[route.strip()] = float(seconds)
+    return values
+
+
+class HedgePolicy:
+    """
+    Per-route timing of hedged RAG reasoning.
+
+    For each route, the hedge delay is how long reasoning runs alone before the
+    vectorstore query is started in parallel, and the budget is how long (from
+    the start) reasoning may take before the vectorstore context is used instead.
+
+    The deadline bounds the whole hedged query; without any context by then the
+    inquiry is forwarded.
+
+    With adaptive tuning, both follow the observed reasoning latency: the delay
+    tracks its median and the budget its `budget_percentile`, capped by the
+    configured values.
+    """
+
+    def __init__(
+        self,
+        latency_tracker: LatencyTracker,
+        budgets: dict[str, float] | None = None,
+        delays: dict[str, float] | None = None,
+        adaptive: bool | None = None,
+    ):
+        self.latency_tracker = latency_tracker
+        self.budgets = budgets if budgets is not None else parse_route_seconds(os.getenv("RAG_HEDGE_BUDGETS", "reasoning_needed=8"))
+        self.delays = delays if delays is not None else parse_route_seconds(os.getenv("RAG_HEDGE_DELAYS", "reasoning_needed=1.5"))
+        self.adaptive = adaptive if adaptive is not None else os.getenv("RAG_HEDGE_ADAPTIVE", "false").lower() == "true"
+        self.default_budget = float(os.getenv("RAG_HEDGE_DEFAULT_BUDGET", "8"))
+        self.deadline = float(os.getenv("RAG_HEDGE_DEADLINE", "30"))
+        self.budget_percentile = float(os.getenv("RAG_HEDGE_BUDGET_PERCENTILE", "0.9"))
+        self.min_budget = float(os.getenv("RAG_HEDGE_MIN_BUDGET", "1"))
+        self.min_samples = int(os.getenv("RAG_HEDGE_MIN_SAMPLES", "20"))
+
+    def for_route(self, route: str, operation: str = "query_reasoning") -> tuple[float, float]:
+        """
+        Get the hedge timing for a route.
+
+        Args:
+            route: The route, e.g. "reasoning_needed"
+            operation: The latency-tracker name of the primary operation
+
+        Returns:
+            (hedge_delay, budget) in seconds
+        """
+        budget = self.budgets.get(route, self.default_budget)
+        delay = min(self.delays.get(route, 0.0), budget)
+
+        if self.adaptive and self.latency_tracker.count(operation) >= self.min_samples:
+            observed_budget = self.latency_tracker.percentile(operation, self.budget_percentile)
+            observed_delay = self.latency_tracker.percentile(operation, 0.5)
+            if observed_budget is not None and observed_delay is not None:
+                budget = min(budget, max(self.min_budget, observed_budget))
+                delay = min(delay, observed_delay, budget)
+
+        return delay, budget
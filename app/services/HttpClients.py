@@ -8,6 +8,12 @@ class PhoBERTTelecomGateClient:
     
     def __init__(self, base_url: str | None = None):
         self.base_url = base_url or os.getenv("PHOBERT_TELECOMGATE_BASE_URL", "http://localhost:8136/v1")
+        # Reuse connections across calls instead of reconnecting on every inference
+        self.session = requests.Session()
+    
+    def warm_up(self):
+        """Open the connection to the API with a sample inference."""
+        self.infer("xin chào")
     
     def infer(self, text: str) -> bool:
         """
@@ -23,7 +29,7 @@ class PhoBERTTelecomGateClient:
             Exception: If the API returns an error status code
         """
         url = f"{self.base_url}/infer"
-        response = requests.post(url, headers={"Content-Type": "text/plain"}, data=text.encode('utf-8'))
+        response = self.session.post(url, headers={"Content-Type": "text/plain"}, data=text.encode('utf-8'))
         
         if response.status_code == 200:
             result = response.text.strip()
@@ -42,6 +48,12 @@ class ReasoningRouterClient:
     
     def __init__(self, base_url: str | None = None):
         self.base_url = base_url or os.getenv("REASONING_ROUTER_BASE_URL", "http://localhost:8237/v1")
+        # Reuse connections across calls instead of reconnecting on every inference
+        self.session = requests.Session()
+    
+    def warm_up(self):
+        """Open the connection to the API with a sample inference."""
+        self.infer("xin chào")
     
     def infer(self, text: str) -> Literal["lookup_only", "reasoning_needed"]:
         """
@@ -57,7 +69,7 @@ class ReasoningRouterClient:
             Exception: If the API returns an error status code
         """
         url = f"{self.base_url}/infer"
-        response = requests.post(url, headers={"Content-Type": "text/plain"}, data=text.encode('utf-8'))
+        response = self.session.post(url, headers={"Content-Type": "text/plain"}, data=text.encode('utf-8'))
         
         if response.status_code == 200:
             result = response.text.strip()
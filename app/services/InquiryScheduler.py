@@ -0,0 +1,151 @@
+import os
+import heapq
+import itertools
+import threading
+import time
+import zlib
+from typing import Callable
+
+
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+FAST_LANE = "fast"
+STANDARD_LANE = "standard"
+
+
+class ScheduledInquiry:
+    """A request message waiting in the scheduler, with its scheduling attributes."""
+
+    def __init__(
+        self,
+        message: dict,
+        ack: Callable[[], None],
+        tenant: str,
+        priority: int,
+        lane: str,
+        route: str | None = None,
+    ):
+        self.message = message
+        self.ack = ack
+        self.tenant = tenant
+        self.priority = priority
+        self.lane = lane
+        self.route = route
+        self.enqueued_at = time.time()
+
+
+class InquiryScheduler:
+    """
+    In-process scheduler for inquiries pulled off the request queue.
+
+    Inquiries are split into lanes (a reserved fast lane for short trivial and
+    lookup-only inquiries, and the standard lane), then into strict priority
+    classes. Within a class, tenants share service by weight using start-time
+    fair queuing, so one flooding tenant cannot starve the others.
+    """
+
+    def __init__(self, tenant_weights: dict[str, float] | None = None):
+        if tenant_weights is None:
+            tenant_weights = parse_tenant_weights(os.getenv("SCHEDULER_TENANT_WEIGHTS", ""))
+        self.tenant_weights = tenant_weights
+
+        # lane -> priority -> heap of (tag, sequence, inquiry)
+        self._queues: dict[str, dict[int, list[tuple[float, int, ScheduledInquiry]]]] = {
+            FAST_LANE: {},
+            STANDARD_LANE: {},
+        }
+        self._virtual_time: dict[tuple[str, int], float] = {}
+        self._last_tags: dict[tuple[str, int, str], float] = {}
+        self._sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def weight(self, tenant: str) -> float:
+        return self.tenant_weights.get(tenant, 1.0)
+
+    def submit(self, inquiry: ScheduledInquiry):
+        """Enqueue an inquiry, tagging it with its tenant's virtual finish time."""
+        with self.condition:
+            queue_key = (inquiry.lane, inquiry.priority)
+            tenant_key = (inquiry.lane, inquiry.priority, inquiry.tenant)
+
+            start = max(self._virtual_time.get(queue_key, 0.0), self._last_tags.get(tenant_key, 0.0))
+            tag = start + 1.0 / self.weight(inquiry.tenant)
+            self._last_tags[tenant_key] = tag
+
+            heap = self._queues[inquiry.lane].setdefault(inquiry.priority, [])
+            heapq.heappush(heap, (tag, next(self._sequence), inquiry))
+            self.condition.notify_all()
+
+    def take(self, lanes: tuple[str, ...], timeout: float | None = None) -> ScheduledInquiry | None:
+        """
+        Block until an inquiry is available in one of the lanes and dequeue it.
+
+        Args:
+            lanes: Lanes this worker serves, in order of preference
+            timeout: Longest time to wait in seconds, or None to wait indefinitely
+
+        Returns:
+            The next inquiry: first non-empty lane, highest priority class,
+            smallest fair-queuing tag. None if the timeout expired.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.condition:
+            while True:
+                inquiry = self._pop(lanes)
+                if inquiry is not None:
+                    return inquiry
+                if deadline is None:
+                    self.condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def _pop(self, lanes: tuple[str, ...]) -> ScheduledInquiry | None:
+        for lane in lanes:
+            classes = self._queues[lane]
+            for priority in sorted(classes):
+                heap = classes[priority]
+                if not heap:
+                    continue
+
+                tag, _, inquiry = heapq.heappop(heap)
+                self._virtual_time[(lane, priority)] = tag
+                if not heap:
+                    # Idle tenants must not bank credit for later bursts
+                    self._forget_tags(lane, priority)
+                return inquiry
+        return None
+
+    def _forget_tags(self, lane: str, priority: int):
+        for key in [key for key in self._last_tags if key[0] == lane and key[1] == priority]:
+            del self._last_tags[key]
+
+    def backlog(self) -> dict[str, int]:
+        """Number of waiting inquiries per lane."""
+        with self.condition:
+            return {
+                lane: sum(len(heap) for heap in classes.values())
+                for lane, classes in self._queues.items()
+            }
+
+
+def partition_queue(request_queue: str, priority_name: str, bucket: int) -> str:
+    """Name of the broker queue holding one priority class of one tenant bucket."""
+    return f"{request_queue}.{priority_name}.{bucket}"
+
+
+def tenant_bucket(tenant: str, buckets: int) -> int:
+    """Stable bucket of a tenant, the same on every replica."""
+    return zlib.crc32(tenant.encode("utf-8")) % buckets
+
+
+def parse_tenant_weights(spec: str) -> dict[str, float]:
+    """Parse "tenant_a=2,tenant_b=0.5" into a weight mapping."""
+    weights: dict[str, float] = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        tenant, _, weight = entry.partition("=")
+        weights[tenant.strip()] = float(weight)
+    return weights
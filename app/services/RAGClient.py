@@ -1,8 +1,10 @@
 import os
 import uuid
+import time
 import threading
 from typing import Any
 from .MessageQueueService import MessageQueueService
+from ..utils.InstrumentedLock import InstrumentedLock
 
 
 class RAGClient:
@@ -11,6 +13,7 @@ class RAGClient:
     def __init__(self, mq: MessageQueueService | None = None):
         self.request_queue = os.getenv("RAG_REQUEST_QUEUE", "telcenter_rag_text_requests")
         self.response_queue = os.getenv("RAG_RESPONSE_QUEUE", "telcenter_rag_text_responses")
+        self.updates_exchange = os.getenv("RAG_UPDATES_EXCHANGE", "")
         
         if mq is None:
             self.mq = MessageQueueService()
@@ -22,12 +25,32 @@ class RAGClient:
         
         # For synchronous request-response pattern
         self.pending_requests: dict[str, dict] = {}
-        self.lock = threading.Lock()
+        # Requests still awaiting a response, republished if the listener reconnects
+        self.in_flight: dict[str, dict] = {}
+        self.lock = InstrumentedLock("RAGClient.condition")
         self.condition = threading.Condition(self.lock)
         
+        # Requests are published on self.mq, shared by all calling threads
+        self.publish_lock = InstrumentedLock("RAGClient.publish_lock")
+        self.listener_ready = threading.Event()
+        
+        # When the RAG ground truth last changed; contexts fetched earlier are stale.
+        # Sessions are shared between replicas, so this is a wall-clock time rather than
+        # a local counter. Until a notification arrives, anything cached before this
+        # replica started is treated as stale, since it may predate an update we missed.
+        self.data_updated_at = time.time()
+        
         # Start a background thread to listen for responses
         self.listener_thread = threading.Thread(target=self._listen_for_responses, daemon=True)
         self.listener_thread.start()
+        
+        if self.updates_exchange:
+            self.updates_thread = threading.Thread(target=self._listen_for_updates, daemon=True)
+            self.updates_thread.start()
+        
+        if self.mq.keep_alive_interval is not None:
+            self.keep_alive_thread = threading.Thread(target=self._keep_alive, daemon=True)
+            self.keep_alive_thread.start()
     
     def _listen_for_responses(self):
         """Background thread that listens for responses from RAG service."""
@@ -35,8 +58,58 @@ class RAGClient:
         listener_mq = self.mq.clone()
         listener_mq.declare_queue(self.response_queue)
         listener_mq.register_callback(self.response_queue, self._handle_response)
+        listener_mq.add_reconnect_listener(self._rehome_in_flight)
+        self.listener_ready.set()
         listener_mq.start_consuming()
     
+    def _listen_for_updates(self):
+        """Background thread that listens for RAG data update notifications."""
+        updates_mq = self.mq.clone()
+        queue_name = updates_mq.declare_fanout_queue(self.updates_exchange)
+        updates_mq.register_callback(queue_name, lambda message: self.notify_data_updated(
+            message.get("updated_at") if isinstance(message, dict) else None
+        ))
+        updates_mq.start_consuming()
+    
+    def _keep_alive(self):
+        """Background thread that services heartbeats of the request publishing connection."""
+        while True:
+            time.sleep(self.mq.keep_alive_interval)  # type: ignore[arg-type]
+            with self.publish_lock:
+                self.mq.process_events()
+    
+    def _rehome_in_flight(self):
+        """
+        Republish requests still awaiting a response after the listener reconnected,
+        in case they were lost with the connection. A response that arrives twice is
+        ignored the second time.
+        """
+        with self.condition:
+            requests = list(self.in_flight.values())
+        if not requests:
+            return
+        
+        print(f"[RAGClient] Listener reconnected, republishing {len(requests)} in-flight requests")
+        with self.publish_lock:
+            for request in requests:
+                self.mq.publish_message(self.request_queue, request)
+    
+    def notify_data_updated(self, updated_at: float | None = None):
+        """
+        Mark the RAG ground truth as changed, invalidating contexts cached by callers.
+
+        Args:
+            updated_at: Unix time of the update as announced by the RAG service;
+                defaults to the time the notification is received
+        """
+        try:
+            updated_at = float(updated_at) if updated_at is not None else time.time()
+        except (TypeError, ValueError):
+            updated_at = time.time()
+        with self.lock:
+            self.data_updated_at = max(self.data_updated_at, updated_at)
+        print(f"[RAGClient] RAG data updated at {self.data_updated_at:.3f}")
+    
     def _handle_response(self, message: dict):
         """Handle incoming response from RAG service."""
         print(f"[RAGClient] Received response: {message}")
@@ -44,8 +117,11 @@ class RAGClient:
         request_id = message.get("id")
         if request_id:
             with self.condition:
-                self.pending_requests[request_id] = message
-                self.condition.notify_all()
+                # Responses to timed-out or already answered requests would never be collected
+                if request_id in self.in_flight:
+                    del self.in_flight[request_id]
+                    self.pending_requests[request_id] = message
+                    self.condition.notify_all()
     
     def _send_request_and_wait(self, method: str, params: dict | list, timeout: float = 70.0) -> Any:
         """
@@ -69,21 +145,26 @@ class RAGClient:
             "id": request_id
         }
 
-        mq = self.mq.clone()
-        mq.declare_queue(self.response_queue)
-        mq.declare_queue(self.request_queue)
-        mq.publish_message(self.request_queue, request)
-        
         with self.condition:
-            print(f"[RAGClient] Waiting for response to request ID {request_id}")
-            
-            # Wait for response
-            self.condition.wait_for(lambda: request_id in self.pending_requests, timeout=timeout)
-            
-            if request_id not in self.pending_requests:
-                raise Exception(f"RAG request timed out after {timeout} seconds")
+            self.in_flight[request_id] = request
+        
+        try:
+            with self.publish_lock:
+                self.mq.publish_message(self.request_queue, request)
             
-            response = self.pending_requests.pop(request_id)
+            with self.condition:
+                print(f"[RAGClient] Waiting for response to request ID {request_id}")
+                
+                # Wait for response
+                self.condition.wait_for(lambda: request_id in self.pending_requests, timeout=timeout)
+                
+                if request_id not in self.pending_requests:
+                    raise Exception(f"RAG request timed out after {timeout} seconds")
+                
+                response = self.pending_requests.pop(request_id)
+        finally:
+            with self.condition:
+                self.in_flight.pop(request_id, None)
         
         result = response.get("result", {})
         status = result.get("status")
@@ -97,6 +178,15 @@ class RAGClient:
         
         return content
     
+    def warm_up(self, timeout: float = 20.0):
+        """
+        Wait for the response listener and make a sample vectorstore query,
+        so the first real request does not pay connection setup costs.
+        """
+        if not self.listener_ready.wait(timeout):
+            raise Exception("RAG response listener did not start in time")
+        self._send_request_and_wait("query_vectordb", {"query": "gói cước"}, timeout=timeout)
+    
     def query_vectordb(self, query: str) -> str:
         """
         Query the RAG vectorstore for context.
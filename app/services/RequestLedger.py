@@ -0,0 +1,76 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+
+class RequestLedger:
+    """
+    Tracks request ids being handled or recently answered, so a request the
+    broker redelivers after a reconnect is not answered a second time.
+
+    A duplicate of a request still being handled is acknowledged once the
+    original has finished; a duplicate of an answered request right away.
+    """
+
+    def __init__(self, max_answered: int | None = None):
+        self.max_answered = max_answered or int(os.getenv("REQUEST_DEDUP_MAX_ENTRIES", "10000"))
+        self._answered: OrderedDict[str, None] = OrderedDict()
+        self._in_progress: dict[str, list[Callable[[], None]]] = {}
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def begin(self, request_id: str, ack: Callable[[], None]) -> bool:
+        """
+        Claim a request for handling.
+
+        Args:
+            request_id: The request's id
+            ack: Acknowledges this delivery; used if it turns out to be a duplicate
+
+        Returns:
+            True if the caller should handle the request, False for a duplicate
+        """
+        with self.lock:
+            if request_id in self._in_progress:
+                self._in_progress[request_id].append(ack)
+                self.duplicates += 1
+                return False
+
+            answered = request_id in self._answered
+            if not answered:
+                self._in_progress[request_id] = []
+                return True
+            self.duplicates += 1
+
+        print(f"[RequestLedger] Request {request_id} was already answered, skipping redelivery")
+        ack()
+        return False
+
+    def finish(self, request_id: str):
+        """Record a request as answered and acknowledge duplicates that waited for it."""
+        with self.lock:
+            waiting = self._in_progress.pop(request_id, [])
+            self._answered[request_id] = None
+            self._answered.move_to_end(request_id)
+            while len(self._answered) > self.max_answered:
+                self._answered.popitem(last=False)
+
+        for ack in waiting:
+            ack()
+
+    def abandon(self, request_id: str) -> Callable[[], None] | None:
+        """
+        Release a request whose answer could not be delivered, so that a
+        redelivery of it is handled again rather than skipped.
+
+        Returns:
+            The ack of a duplicate that waited for it, which the caller now
+            holds the claim for and should handle, or None
+        """
+        with self.lock:
+            waiting = self._in_progress.pop(request_id, [])
+            if not waiting:
+                return None
+            self._in_progress[request_id] = waiting[1:]
+            return waiting[0]
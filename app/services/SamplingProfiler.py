@@ -0,0 +1,144 @@
+import os
+import re
+import math
+import sys
+import time
+import threading
+from collections import Counter
+from ..utils.InstrumentedLock import LockWaitStats, default_lock_stats
+
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler for all threads of the process.
+
+    While running, a background thread snapshots every other thread's stack at
+    a fixed interval and counts identical stacks. The result is exported in the
+    folded format ("root;caller;callee count") understood by flamegraph.pl and
+    speedscope. Starting the profiler also enables lock-wait statistics.
+    """
+
+    # Shorter intervals make the sampler spin on stack walks and starve the GIL
+    MIN_INTERVAL = 0.001
+    MAX_INTERVAL = 10.0
+
+    def __init__(self, interval: float | None = None, lock_stats: LockWaitStats | None = None, max_depth: int = 64):
+        if interval is None:
+            interval = float(os.getenv("PROFILER_INTERVAL_MS", "10")) / 1000
+        self.interval = self.validate_interval(interval)
+        self.lock_stats = lock_stats or default_lock_stats
+        self.max_depth = max_depth
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.started_at: float | None = None
+        self.profiled_seconds = 0.0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @classmethod
+    def validate_interval(cls, interval: float) -> float:
+        """
+        Raises:
+            ValueError: If the interval is not between MIN_INTERVAL and MAX_INTERVAL seconds
+        """
+        if not math.isfinite(interval) or not cls.MIN_INTERVAL <= interval <= cls.MAX_INTERVAL:
+            raise ValueError(
+                f"Sampling interval must be between {cls.MIN_INTERVAL * 1000:.0f}ms and {cls.MAX_INTERVAL * 1000:.0f}ms"
+            )
+        return interval
+
+    def start(self, interval: float | None = None):
+        """
+        Start sampling, optionally with a new interval in seconds.
+
+        Raises:
+            ValueError: If the interval is out of range
+        """
+        if interval is not None:
+            interval = self.validate_interval(interval)
+        with self.lock:
+            if self.running:
+                return
+            if interval is not None:
+                self.interval = interval
+            self._stop.clear()
+            self.started_at = time.time()
+            self.lock_stats.enabled = True
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        print(f"[SamplingProfiler] Started, sampling every {self.interval * 1000:.0f}ms")
+
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return
+            self._stop.set()
+            thread = self._thread
+        thread.join()  # type: ignore[union-attr]
+        with self.lock:
+            self.lock_stats.enabled = False
+            self.profiled_seconds += time.time() - (self.started_at or time.time())
+            self.started_at = None
+        print("[SamplingProfiler] Stopped")
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.profiled_seconds = 0.0
+            if self.started_at is not None:
+                self.started_at = time.time()
+        self.lock_stats.reset()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: _thread_group(thread.name) for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            sampled: list[str] = []
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                sampled.append(self._fold(names.get(ident, "unknown"), frame))
+
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def _fold(self, thread_name: str, frame) -> str:
+        labels: list[str] = []
+        while frame is not None and len(labels) < self.max_depth:
+            code = frame.f_code
+            labels.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        labels.append(thread_name)
+        return ";".join(reversed(labels))
+
+    def folded(self) -> str:
+        """Aggregated stacks in folded format, one "stack count" line each."""
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def status(self) -> dict:
+        with self.lock:
+            elapsed = self.profiled_seconds
+            if self.started_at is not None:
+                elapsed += time.time() - self.started_at
+            return {
+                "running": self.running,
+                "interval_ms": self.interval * 1000,
+                "samples": self.samples,
+                "distinct_stacks": len(self.stacks),
+                "profiled_seconds": round(elapsed, 3),
+                "lock_waits": self.lock_stats.snapshot(),
+            }
+
+
+def _thread_group(name: str) -> str:
+    """Merge numbered threads of the same kind, e.g. "Thread-3 (_consume)" -> "Thread (_consume)"."""
+    return re.sub(r"[-_]\d+", "", name).replace(";", ",")
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+
+def split_turns(history: str) -> list[str]:
+    """
+    Split a "User: ...\nAgent: ..." history string into turns, each starting at
+    a "User:" line. Histories without such lines are split into lines.
+    """
+    lines = [line for line in history.splitlines() if line.strip()]
+    if not any(line.startswith("User:") for line in lines):
+        return lines
+
+    turns: list[str] = []
+    for line in lines:
+        if line.startswith("User:") or not turns:
+            turns.append(line)
+        else:
+            turns[-1] = f"{turns[-1]}\n{line}"
+    return turns
+
+
+class ConversationSession:
+    """
+    Server-side state of a single conversation.
+
+    Keeps the recent history turns verbatim, moves older turns into a
+    length-bounded older history (oldest lines dropped first), and remembers the last route decision and RAG context so that
+    follow-up turns do not need to resend or recompute them.
+    """
+
+    def __init__(
+        self,
+        conversation_id: str,
+        turns: list[str] | None = None,
+        older_history: str = "",
+        last_route: str | None = None,
+        last_context: str | None = None,
+        context_fetched_at: float = 0.0,
+        package_codes: list[str] | None = None,
+        updated_at: float | None = None,
+    ):
+        self.conversation_id = conversation_id
+        self.turns = turns or []
+        self.older_history = older_history
+        self.last_route = last_route
+        self.last_context = last_context
+        self.context_fetched_at = context_fetched_at
+        self.package_codes = package_codes or []
+        self.updated_at = updated_at or time.time()
+
+    def reset_history(self, history: str):
+        """
+        Replace the stored history with a caller-provided history string.
+
+        Args:
+            history: The full chat history as sent by the caller
+        """
+        self.older_history = ""
+        self.turns = split_turns(history)
+
+    def append_turn(self, inquiry: str, answer: str, max_turns: int, older_history_max_chars: int):
+        """
+        Append a completed exchange, moving the oldest turns into the older history.
+
+        Args:
+            inquiry: The user's inquiry
+            answer: The agent's full answer
+            max_turns: Number of turns kept verbatim
+            older_history_max_chars: Maximum length of the older history
+        """
+        self.turns.append(f"User: {inquiry}\nAgent: {answer}")
+
+        while len(self.turns) > max_turns:
+            oldest = self.turns.pop(0)
+            older_history = f"{self.older_history}\n{oldest}".strip()
+            if len(older_history) > older_history_max_chars:
+                # Drop the oldest lines first so what remains stays readable
+                older_history = older_history[-older_history_max_chars:]
+                newline = older_history.find("\n")
+                if newline != -1:
+                    older_history = older_history[newline + 1:]
+            self.older_history = older_history
+
+        self.updated_at = time.time()
+
+    def adopt_retrieval_state(self, other: "ConversationSession"):
+        """Copy the route decision and RAG context computed on another session."""
+        self.last_route = other.last_route
+        self.last_context = other.last_context
+        self.context_fetched_at = other.context_fetched_at
+
+    def render_history(self) -> str:
+        """Render the older history and recent turns as a history string for prompts."""
+        parts = [self.older_history] if self.older_history else []
+        parts.extend(self.turns)
+        return "\n".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "conversation_id": self.conversation_id,
+            "turns": self.turns,
+            "older_history": self.older_history,
+            "last_route": self.last_route,
+            "last_context": self.last_context,
+            "context_fetched_at": self.context_fetched_at,
+            "package_codes": self.package_codes,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ConversationSession":
+        return cls(
+            conversation_id=data["conversation_id"],
+            turns=list(data.get("turns", [])),
+            older_history=data.get("older_history", ""),
+            last_route=data.get("last_route"),
+            last_context=data.get("last_context"),
+            context_fetched_at=data.get("context_fetched_at", 0.0),
+            package_codes=list(data.get("package_codes", [])),
+            updated_at=data.get("updated_at"),
+        )
+
+
+class SessionStore(ABC):
+    """Base class for conversation session backends."""
+
+    @abstractmethod
+    def get(self, conversation_id: str) -> ConversationSession | None:
+        ...
+
+    @abstractmethod
+    def put(self, session: ConversationSession):
+        ...
+
+    @abstractmethod
+    def delete(self, conversation_id: str):
+        ...
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Bounded in-process session store with LRU and TTL eviction.
+
+    Suitable for a single replica. Sessions are lost on restart. Like the Redis
+    backend, it hands out and stores copies, so changes to a session only take
+    effect once it is `put` back.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: OrderedDict[str, ConversationSession] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> ConversationSession | None:
+        with self.lock:
+            session = self._sessions.get(conversation_id)
+            if session is None:
+                return None
+
+            if time.time() - session.updated_at > self.ttl_seconds:
+                del self._sessions[conversation_id]
+                return None
+
+            self._sessions.move_to_end(conversation_id)
+        return ConversationSession.from_dict(session.to_dict())
+
+    def put(self, session: ConversationSession):
+        stored = ConversationSession.from_dict(session.to_dict())
+        with self.lock:
+            self._sessions[session.conversation_id] = stored
+            self._sessions.move_to_end(session.conversation_id)
+            self._evict()
+
+    def delete(self, conversation_id: str):
+        with self.lock:
+            self._sessions.pop(conversation_id, None)
+
+    def _evict(self):
+        """Drop expired sessions from the LRU end, then enforce the size bound."""
+        now = time.time()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.updated_at <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Shared session store backed by Redis, for running multiple replicas.
+
+    Requires the optional `redis` package. Eviction is delegated to Redis
+    key expiry (TTL) and its configured `maxmemory-policy`.
+    """
+
+    def __init__(self, redis_url: str | None = None, ttl_seconds: float = 3600.0, key_prefix: str = "telcenter_ai_agent:session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The 'redis' package is required for SESSION_STORE_BACKEND=redis") from e
+
+        self.redis_url = redis_url or os.getenv("SESSION_STORE_REDIS_URL", "redis://localhost:6379/0")
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self.client: Any = redis.Redis.from_url(self.redis_url)
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self.key_prefix}{conversation_id}"
+
+    def get(self, conversation_id: str) -> ConversationSession | None:
+        raw = self.client.get(self._key(conversation_id))
+        if raw is None:
+            return None
+        return ConversationSession.from_dict(json.loads(raw))
+
+    def put(self, session: ConversationSession):
+        self.client.set(
+            self._key(session.conversation_id),
+            json.dumps(session.to_dict()),
+            ex=int(self.ttl_seconds),
+        )
+
+    def delete(self, conversation_id: str):
+        self.client.delete(self._key(conversation_id))
+
+
+def create_session_store() -> SessionStore | None:
+    """
+    Create the session store configured by environment variables.
+
+    Returns:
+        The configured store, or None if sessions are disabled
+    """
+    backend = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return InMemorySessionStore(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")),
+            ttl_seconds=ttl_seconds,
+        )
+    if backend == "redis":
+        return RedisSessionStore(ttl_seconds=ttl_seconds)
+
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {backend}")
@@ -0,0 +1,161 @@
+import threading
+from typing import Any, Callable, Hashable, Iterator
+
+
+class _Call:
+    """An in-flight call whose result is shared by every caller with the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls with the same key.
+
+    The first caller (the leader) runs the function; callers arriving while it
+    is in flight wait for and share its result or exception. Once the call
+    completes the key is forgotten, so later calls run again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once per key among concurrent callers.
+
+        Args:
+            key: Identifies identical calls
+            fn: The function to run if no identical call is in flight
+
+        Returns:
+            The (possibly shared) result of fn
+
+        Raises:
+            Exception: The exception raised by fn, re-raised to every waiting caller
+        """
+        with self.lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            if is_leader:
+                raise call.error
+            raise Exception(str(call.error)) from call.error
+        return call.result
+
+
+class StreamFlight:
+    """
+    A token stream produced once and fanned out to every subscriber.
+
+    The producer runs on its own thread and buffers every token, so
+    subscribers that join late still receive the stream from the beginning,
+    and a slow subscriber never holds back the others.
+    """
+
+    def __init__(self, factory: Callable[[], Iterator[Any]], payload: Any = None):
+        self.factory = factory
+        self.payload = payload
+        self.tokens: list[Any] = []
+        self.finished = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self.condition = threading.Condition()
+
+    def run(self, on_finished: Callable[[], None]):
+        """Drain the producer into the buffer. Runs on the flight's own thread."""
+        try:
+            for token in self.factory():
+                with self.condition:
+                    self.tokens.append(token)
+                    self.condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            on_finished()
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def subscribe(self) -> Iterator[Any]:
+        """
+        Iterate the shared stream from its first token.
+
+        Raises:
+            Exception: The producer's exception, once all buffered tokens were yielded
+        """
+        index = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: index < len(self.tokens) or self.finished)
+                pending = self.tokens[index:]
+                finished = self.finished
+
+            for token in pending:
+                yield token
+            index += len(pending)
+
+            if finished and index >= len(self.tokens):
+                break
+
+        if self.error is not None:
+            raise Exception(str(self.error)) from self.error
+
+
+class StreamSingleFlight:
+    """Deduplicates concurrent identical token streams by key."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._flights: dict[Hashable, StreamFlight] = {}
+
+    def join(self, key: Hashable, factory: Callable[[], Iterator[Any]], payload: Any = None) -> StreamFlight:
+        """
+        Join the in-flight stream for key, starting it if there is none.
+
+        Args:
+            key: Identifies identical streams
+            factory: Creates the token iterator; only called for the first caller
+            payload: Arbitrary state kept with the flight (only the first caller's is kept)
+
+        Returns:
+            The shared flight; iterate flight.subscribe() to consume it
+        """
+        with self.lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                print(f"[SingleFlight] Joined in-flight stream ({flight.subscribers} subscribers)")
+                return flight
+
+            flight = StreamFlight(factory, payload)
+            flight.subscribers = 1
+            self._flights[key] = flight
+
+        def _forget():
+            with self.lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+        threading.Thread(target=flight.run, args=(_forget,), daemon=True).start()
+        return flight
@@ -0,0 +1,156 @@
+import os
+import queue
+import threading
+import time
+from typing import Iterator
+
+
+class _End:
+    """Marks the end of the source stream, optionally with the error that ended it."""
+
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class StreamPipelineMetrics:
+    """Counters shared by every pipelined stream of the server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams = 0
+        self.tokens = 0
+        self.overflows = 0
+        self.coalesced_tokens = 0
+        self.producer_blocked_seconds = 0.0
+        self.max_depth = 0
+
+    def record_stream(self):
+        with self.lock:
+            self.streams += 1
+
+    def record_token(self, depth: int):
+        with self.lock:
+            self.tokens += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def record_overflow(self, coalesced: bool, blocked_seconds: float = 0.0):
+        with self.lock:
+            self.overflows += 1
+            if coalesced:
+                self.coalesced_tokens += 1
+            self.producer_blocked_seconds += blocked_seconds
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "streams": self.streams,
+                "tokens": self.tokens,
+                "overflows": self.overflows,
+                "coalesced_tokens": self.coalesced_tokens,
+                "producer_blocked_seconds": round(self.producer_blocked_seconds, 3),
+                "max_depth": self.max_depth,
+            }
+
+
+class PipelinedStream:
+    """
+    Reads a token stream on a producer thread into a bounded buffer.
+
+    The consumer (the thread owning the broker connection) iterates this object
+    and publishes, so generation and publishing overlap instead of alternating.
+    When the buffer is full, the backpressure policy decides what happens:
+
+    - "block": the producer waits, which in turn stops reading from the LLM
+    - "coalesce": the producer keeps reading and concatenates tokens until
+      there is room again, so no text is lost but fewer, larger messages are sent
+
+    Tokens buffered before a source error are still delivered, then the error
+    is raised to the consumer.
+    """
+
+    POLICIES = ("block", "coalesce")
+
+    def __init__(
+        self,
+        source: Iterator[str],
+        capacity: int | None = None,
+        policy: str | None = None,
+        metrics: StreamPipelineMetrics | None = None,
+    ):
+        self.source = source
+        self.capacity = capacity or int(os.getenv("STREAM_BUFFER_SIZE", "64"))
+        self.policy = (policy or os.getenv("STREAM_BACKPRESSURE", "block")).lower()
+        if self.policy not in self.POLICIES:
+            raise ValueError(f"Unknown STREAM_BACKPRESSURE policy: {self.policy}")
+        self.metrics = metrics or StreamPipelineMetrics()
+
+        self.buffer: queue.Queue = queue.Queue(maxsize=self.capacity)
+        self.closed = threading.Event()
+        self.producer = threading.Thread(target=self._produce, daemon=True)
+
+    def __iter__(self) -> Iterator[str]:
+        self.metrics.record_stream()
+        self.producer.start()
+        try:
+            while True:
+                item = self.buffer.get()
+                if isinstance(item, _End):
+                    if item.error is not None:
+                        raise item.error
+                    return
+                yield item
+        finally:
+            # Stop the producer if the consumer gave up early (e.g. publish failed)
+            self.closed.set()
+
+    def _produce(self):
+        carry = ""
+        try:
+            for token in self.source:
+                if self.closed.is_set():
+                    break
+                if not token:
+                    continue
+
+                if self.policy == "coalesce":
+                    carry = self._offer(carry + token)
+                else:
+                    self._put(token)
+            else:
+                if carry:
+                    self._put(carry)
+                self._put(_End())
+        except BaseException as e:
+            if carry:
+                self._put(carry)
+            self._put(_End(e))
+        finally:
+            if self.closed.is_set() and hasattr(self.source, "close"):
+                self.source.close()
+
+    def _offer(self, token: str) -> str:
+        """Enqueue without blocking; return what could not be enqueued yet."""
+        try:
+            self.buffer.put_nowait(token)
+            self.metrics.record_token(self.buffer.qsize())
+            return ""
+        except queue.Full:
+            self.metrics.record_overflow(coalesced=True)
+            return token
+
+    def _put(self, item):
+        """Enqueue, blocking while the buffer is full and the consumer is still there."""
+        try:
+            self.buffer.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            while not self.closed.is_set():
+                try:
+                    self.buffer.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            self.metrics.record_overflow(coalesced=False, blocked_seconds=time.monotonic() - start)
+
+        if not isinstance(item, _End):
+            self.metrics.record_token(self.buffer.qsize())
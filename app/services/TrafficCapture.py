@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import zlib
+import time
+import random
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+
+# Each record: magic, payload length, CRC32 of the payload, zlib-compressed JSON payload
+RECORD_MAGIC = b"TCR1"
+RECORD_HEADER = struct.Struct(">4sII")
+
+# Must not start inside a word, or "SD70 0912345678" would lose the end of the package code
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:\+?84|0)(?:[\s.-]?\d){8,10}\b")
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+LONG_NUMBER_PATTERN = re.compile(r"\b\d{9,}\b")
+
+
+def sanitize(text: str) -> str:
+    """Mask phone numbers, e-mail addresses and long ID-like numbers."""
+    text = EMAIL_PATTERN.sub("<email>", text)
+    text = PHONE_PATTERN.sub("<phone>", text)
+    return LONG_NUMBER_PATTERN.sub("<number>", text)
+
+
+class CaptureRecord:
+    """
+    Everything needed to replay one inquiry: sanitized inputs, classifier
+    decisions, RAG calls with their contexts, LLM token timings and the
+    duration of every pipeline stage.
+    """
+
+    def __init__(self, inquiry: str, history: str):
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.data: dict[str, Any] = {
+            "started_at": self.started_at,
+            "inquiry": sanitize(inquiry),
+            "history": sanitize(history),
+            "classifiers": {},
+            "rag_calls": [],
+            "context": None,
+            "tokens": [],
+            "stages": {},
+            "outcome": None,
+        }
+        self._generation_start: float | None = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure the duration of a pipeline stage."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                stages = self.data["stages"]
+                stages[name] = stages.get(name, 0.0) + time.monotonic() - start
+
+    def classifier(self, name: str, decision: Any, duration: float):
+        with self.lock:
+            self.data["classifiers"][name] = {"decision": decision, "duration": duration}
+
+    def rag_call(self, method: str, params: dict, duration: float, context: str | None = None, error: str | None = None):
+        with self.lock:
+            self.data["rag_calls"].append({
+                "method": method,
+                "params": {key: sanitize(value) for key, value in params.items()},
+                "duration": duration,
+                "context": context,
+                "error": error,
+            })
+
+    def context(self, context: str, reused: bool):
+        with self.lock:
+            self.data["context"] = context
+            self.data["context_reused"] = reused
+
+    def start_generation(self):
+        self._generation_start = time.monotonic()
+
+    def token(self, token: str):
+        """Record an LLM token with its offset from the start of generation."""
+        offset = time.monotonic() - (self._generation_start or self._start)
+        with self.lock:
+            self.data["tokens"].append([round(offset, 4), sanitize(token)])
+
+    def finish(self, outcome: str, **extra: Any):
+        with self.lock:
+            self.data["outcome"] = outcome
+            self.data["stages"]["total"] = time.monotonic() - self._start
+            self.data.update(extra)
+
+
+class TrafficCapture:
+    """
+    Append-only, rotating binary log of captured inquiries.
+
+    Rotation works like logging's RotatingFileHandler: when the active file
+    would exceed max_bytes it becomes `<path>.1`, older files shift up, and
+    files beyond backup_count are deleted.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        enabled: bool | None = None,
+        max_bytes: int | None = None,
+        backup_count: int | None = None,
+        sample_rate: float | None = None,
+    ):
+        self.enabled = enabled if enabled is not None else os.getenv("CAPTURE_ENABLED", "false").lower() == "true"
+        self.path = Path(path or os.getenv("CAPTURE_PATH", "capture/traffic.tcap"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("CAPTURE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.backup_count = backup_count if backup_count is not None else int(os.getenv("CAPTURE_BACKUP_COUNT", "5"))
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+        self.lock = threading.Lock()
+
+    def start(self, inquiry: str, history: str) -> CaptureRecord | None:
+        """Begin capturing an inquiry, or return None if it is not captured."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return CaptureRecord(inquiry, history)
+
+    def write(self, record: CaptureRecord | None):
+        if record is None:
+            return
+
+        with record.lock:
+            payload = zlib.compress(json.dumps(record.data, ensure_ascii=False).encode("utf-8"))
+        frame = RECORD_HEADER.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+        try:
+            with self.lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                if self.path.exists() and self.path.stat().st_size + len(frame) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, "ab") as f:
+                    f.write(frame)
+        except OSError as e:
+            # Capturing must never break request handling
+            print(f"[TrafficCapture] Failed to write capture record: {e}")
+
+    def _rotate(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{index}")
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+
+def read_capture(path: str) -> Iterator[dict]:
+    """
+    Read the records of a capture file, oldest first.
+
+    Raises:
+        ValueError: If the file is corrupt (a truncated last record is skipped)
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            magic, length, checksum = RECORD_HEADER.unpack(header)
+            if magic != RECORD_MAGIC:
+                raise ValueError(f"Corrupt capture file {path}: bad record magic")
+
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            if zlib.crc32(payload) != checksum:
+                raise ValueError(f"Corrupt capture file {path}: checksum mismatch")
+
+            yield json.loads(zlib.decompress(payload))
@@ -0,0 +1,79 @@
+import time
+import threading
+
+
+class LockWaitStats:
+    """Per-lock wait time statistics, collected only while enabled."""
+    
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self._stats: dict[str, dict[str, float]] = {}
+    
+    def record(self, name: str, waited: float):
+        with self.lock:
+            stats = self._stats.setdefault(name, {"acquisitions": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0})
+            stats["acquisitions"] += 1
+            stats["total_wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+    
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            return {
+                name: {
+                    **stats,
+                    "mean_wait_seconds": stats["total_wait_seconds"] / stats["acquisitions"] if stats["acquisitions"] else 0.0,
+                }
+                for name, stats in self._stats.items()
+            }
+    
+    def reset(self):
+        with self.lock:
+            self._stats.clear()
+
+
+# Shared by every instrumented lock of the process, toggled by the profiler
+default_lock_stats = LockWaitStats()
+
+
+class InstrumentedLock:
+    """
+    Drop-in replacement for threading.Lock that records how long callers wait
+    to acquire it while lock statistics are enabled.
+    
+    Can also back a threading.Condition.
+    """
+    
+    def __init__(self, name: str, stats: LockWaitStats | None = None):
+        self.name = name
+        self.stats = stats or default_lock_stats
+        self._lock = threading.Lock()
+    
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if not self.stats.enabled:
+            return self._lock.acquire(blocking, timeout)
+        
+        # Uncontended acquisitions are counted without timing overhead
+        if self._lock.acquire(False):
+            self.stats.record(self.name, 0.0)
+            return True
+        if not blocking:
+            return False
+        
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        if acquired:
+            self.stats.record(self.name, time.perf_counter() - start)
+        return acquired
+    
+    def release(self):
+        self._lock.release()
+    
+    def locked(self) -> bool:
+        return self._lock.locked()
+    
+    def __enter__(self) -> bool:
+        return self.acquire()
+    
+    def __exit__(self, *exc_info):
+        self.release()
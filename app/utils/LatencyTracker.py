@@ -0,0 +1,50 @@
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Thread-safe rolling window of observed latencies, per operation name."""
+    
+    def __init__(self, window_size: int = 500):
+        """
+        Initialize the tracker.
+        
+        Args:
+            window_size: Number of most recent samples kept per operation
+        """
+        self.window_size = window_size
+        self._samples: dict[str, deque[float]] = {}
+        self.lock = threading.Lock()
+    
+    def record(self, name: str, seconds: float):
+        """Record one observed latency for an operation."""
+        with self.lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = deque(maxlen=self.window_size)
+                self._samples[name] = samples
+            samples.append(seconds)
+    
+    def count(self, name: str) -> int:
+        with self.lock:
+            return len(self._samples.get(name, ()))
+    
+    def percentile(self, name: str, q: float) -> float | None:
+        """
+        Get a latency percentile for an operation.
+        
+        Args:
+            name: The operation name
+            q: The percentile as a fraction, e.g. 0.9 for p90
+            
+        Returns:
+            The percentile in seconds, or None if nothing was recorded yet
+        """
+        with self.lock:
+            samples = sorted(self._samples.get(name, ()))
+        
+        if not samples:
+            return None
+        
+        index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+        return samples[index]
@@ -0,0 +1,63 @@
+import time
+
+from app.services.ContextCache import ConversationContextCache, extract_package_codes, refers_to_package
+from app.services.SessionStore import ConversationSession
+
+
+SD70_CONTEXT = (
+    "Gói cước SD70 có giá 70.000 đồng cho 30 ngày sử dụng. "
+    "Ưu đãi 1,5GB data tốc độ cao mỗi ngày, hết lưu lượng tốc độ cao thì dừng truy cập. "
+    "Để đăng ký, khách hàng soạn SD70 gửi 191. "
+    "Khách hàng có thể hủy gói bằng cách soạn HUY SD70 gửi 191. "
+    "Gói cước được tự động gia hạn sau 30 ngày nếu tài khoản còn đủ tiền."
+)
+
+
+def make_session() -> ConversationSession:
+    session = ConversationSession("conversation-1", last_context=SD70_CONTEXT, context_fetched_at=time.time())
+    session.package_codes = ["SD70"]
+    return session
+
+
+def make_cache() -> ConversationContextCache:
+    return ConversationContextCache(threshold=0.6, lexical_weight=0.5, max_age_seconds=600)
+
+
+def test_follow_up_referring_back_to_package_reuses_context():
+    cache = make_cache()
+    assert cache.lookup(make_session(), "Gói đó đăng ký thế nào?", data_updated_at=0.0) == SD70_CONTEXT
+    assert cache.lookup(make_session(), "Làm sao để hủy gói này?", data_updated_at=0.0) == SD70_CONTEXT
+
+
+def test_follow_up_naming_cached_package_reuses_context():
+    cache = make_cache()
+    assert cache.lookup(make_session(), "SD70 giá bao nhiêu?", data_updated_at=0.0) == SD70_CONTEXT
+
+
+def test_inquiry_naming_other_package_is_drift():
+    cache = make_cache()
+    assert cache.score(make_session(), "Còn gói V90B thì sao?") == 0.0
+
+
+def test_code_less_drift_to_other_topic_is_not_reused():
+    cache = make_cache()
+    for inquiry in (
+        "làm sao để khách hàng chuyển vùng quốc tế?",
+        "tôi bị trừ tiền oan, có thể khiếu nại ở đâu?",
+        "cho tôi hỏi cách đổi sim 4G",
+    ):
+        assert cache.score(make_session(), inquiry) < 0.6, inquiry
+        assert cache.lookup(make_session(), inquiry, data_updated_at=0.0) is None, inquiry
+
+
+def test_context_fetched_before_data_update_is_invalidated():
+    cache = make_cache()
+    session = make_session()
+    assert cache.lookup(session, "Gói đó đăng ký thế nào?", data_updated_at=session.context_fetched_at + 1) is None
+    assert session.last_context is None
+
+
+def test_package_code_extraction_and_references():
+    assert extract_package_codes("gói SD 70 và V90B trong 30 ngày") == {"SD70", "V90B"}
+    assert refers_to_package("Gói cước đó còn ưu đãi không?")
+    assert not refers_to_package("Tôi muốn đăng ký gói cước mới")
@@ -0,0 +1,52 @@
+from app.services.RequestLedger import RequestLedger
+
+
+def test_redelivery_of_answered_request_is_acked_and_skipped():
+    ledger = RequestLedger(max_answered=10)
+    acks = []
+
+    assert ledger.begin("r1", lambda: acks.append("first"))
+    ledger.finish("r1")
+
+    assert not ledger.begin("r1", lambda: acks.append("redelivery"))
+    assert acks == ["redelivery"]
+    assert ledger.duplicates == 1
+
+
+def test_redelivery_during_handling_is_acked_once_finished():
+    ledger = RequestLedger(max_answered=10)
+    acks = []
+
+    assert ledger.begin("r1", lambda: acks.append("first"))
+    assert not ledger.begin("r1", lambda: acks.append("redelivery"))
+    assert acks == []
+
+    ledger.finish("r1")
+    assert acks == ["redelivery"]
+
+
+def test_abandoned_request_is_handed_to_waiting_redelivery():
+    ledger = RequestLedger(max_answered=10)
+    acks = []
+
+    assert ledger.begin("r1", lambda: acks.append("first"))
+    assert not ledger.begin("r1", lambda: acks.append("redelivery"))
+
+    next_ack = ledger.abandon("r1")
+    assert next_ack is not None
+    next_ack()
+    assert acks == ["redelivery"]
+    assert ledger.abandon("r1") is None
+
+    # Neither answered nor in progress any more
+    assert ledger.begin("r1", lambda: None)
+
+
+def test_oldest_answered_ids_are_forgotten():
+    ledger = RequestLedger(max_answered=2)
+    for request_id in ("r1", "r2", "r3"):
+        assert ledger.begin(request_id, lambda: None)
+        ledger.finish(request_id)
+
+    assert ledger.begin("r1", lambda: None)
+    assert not ledger.begin("r3", lambda: None)
@@ -0,0 +1,25 @@
+from app.services.SessionStore import ConversationSession, InMemorySessionStore, split_turns
+
+
+def test_changes_only_take_effect_after_put():
+    store = InMemorySessionStore()
+    store.put(ConversationSession("conversation-1", turns=["User: a\nAgent: b"]))
+
+    session = store.get("conversation-1")
+    session.reset_history("User: c\nAgent: d")
+    assert store.get("conversation-1").turns == ["User: a\nAgent: b"]
+
+    store.put(session)
+    session.turns.append("User: e\nAgent: f")
+    assert store.get("conversation-1").turns == ["User: c\nAgent: d"]
+
+
+def test_caller_history_is_moved_into_older_history_turn_by_turn():
+    session = ConversationSession("conversation-1")
+    session.reset_history("User: a\nAgent: b\nUser: c\nAgent: d")
+    assert session.turns == split_turns("User: a\nAgent: b\nUser: c\nAgent: d") == ["User: a\nAgent: b", "User: c\nAgent: d"]
+
+    session.append_turn("e", "f", max_turns=2, older_history_max_chars=100)
+    assert session.older_history == "User: a\nAgent: b"
+    assert session.turns == ["User: c\nAgent: d", "User: e\nAgent: f"]
+    assert session.render_history().startswith("User: a\nAgent: b\nUser: c")
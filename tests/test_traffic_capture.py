@@ -0,0 +1,36 @@
+from app.services.TrafficCapture import TrafficCapture, read_capture, sanitize
+
+
+def test_sanitize_masks_phone_numbers():
+    assert sanitize("gọi 0912345678 nhé") == "gọi <phone> nhé"
+    assert sanitize("số +84 912 345 678") == "số <phone>"
+    assert sanitize("số 84912345678") == "số <phone>"
+
+
+def test_sanitize_keeps_adjacent_package_codes_and_numbers():
+    assert sanitize("gói SD70 0912345678") == "gói SD70 <phone>"
+    assert sanitize("mã đơn 2024 12345678") == "mã đơn 2024 12345678"
+    assert sanitize("gói V90B giá 90000 đồng") == "gói V90B giá 90000 đồng"
+
+
+def test_sanitize_masks_emails_and_long_numbers():
+    assert sanitize("email a.b@example.com") == "email <email>"
+    assert sanitize("CCCD 123456789012") == "CCCD <number>"
+
+
+def test_capture_round_trip_with_rotation(tmp_path):
+    path = tmp_path / "traffic.tcap"
+    capture = TrafficCapture(path=str(path), enabled=True, max_bytes=400, backup_count=2, sample_rate=1.0)
+
+    for index in range(6):
+        record = capture.start(f"câu hỏi {index}", "")
+        record.token("xin chào")
+        record.finish("success")
+        capture.write(record)
+
+    files = [path.with_name(f"{path.name}.2"), path.with_name(f"{path.name}.1"), path]
+    records = [record for file in files if file.exists() for record in read_capture(str(file))]
+    inquiries = [record["inquiry"] for record in records]
+    assert inquiries == sorted(inquiries)
+    assert inquiries[-1] == "câu hỏi 5"
+    assert all(record["outcome"] == "success" for record in records)